@@ -4,6 +4,7 @@ import glob
 import re
 import pandas as pd
 import numpy as np
+import sqlalchemy
 
 ### Initialize a Twitter session
 t = web_tools.Twitter_Session()
@@ -24,26 +25,41 @@ s.set_boilerplate(page_title="solarecho3/Web Tools", metrics=False)
 ### Snapshot a user.
 # t1.get_user_snapshot('elonmusk')
 
-selected_db = st.selectbox(label="Select DB", options=glob.glob("data/*.db"))
+### The catalog only rescans files written since the last run.
+dbs = [i[1] for i in web_tools.Database_Functions().list_db_keys()]
+
+selected_db = st.selectbox(label="Select DB", options=dbs)
+
+### Rows read per table. Lengths come from the catalog, so large tables are never loaded whole.
+rows = st.number_input(label="Rows per table", min_value=1, value=1000, step=1000)
 
 if selected_db:
 
     t1 = web_tools.Database_Functions().list_db_tables(selected_db)
 
+    engine = web_tools.engines.get(selected_db)
+
     # st.write(list(t1))
 
     count = 0
 
     for i in list(t1):
 
-        df = pd.read_sql_table(table_name=i, con=f"sqlite+pysqlite:///{selected_db}")
+        df = pd.read_sql_query(
+            sqlalchemy.select(sqlalchemy.text("*"))
+            .select_from(sqlalchemy.table(i))
+            .limit(rows),
+            con=engine,
+        )
+
+        length = t1[i]["rows"]
 
         st.write(
             f"""
 
         Schema: {(str(i).capitalize())}
 
-        Length: {len(df)}
+        Length: {length}
 
         Count: {count}
         """
@@ -0,0 +1,87 @@
+import json
+import timeit
+
+import requests
+
+import web_tools
+
+"""
+Microbenchmark: JSON parse cost per page of a pagination loop.
+
+Before, each page called requests.Response.json() four times (title, data, meta.next_token, errors), decoding the full body every time. After, Twitter_Response decodes once and serves the cached payload.
+
+$: python bench_json.py
+"""
+
+
+def make_page(n: int = 100) -> requests.Response:
+
+    """
+    Build a requests.Response holding a synthetic page of n tweets.
+    """
+
+    page = {
+        "data": [
+            {
+                "id": str(1580000000000000000 + i),
+                "created_at": "2022-10-29T12:00:00.000Z",
+                "text": "Therefore no more turn me to him, sweet Nan. " * 4,
+                "public_metrics": {
+                    "retweet_count": i,
+                    "reply_count": i,
+                    "like_count": i,
+                    "quote_count": i,
+                },
+            }
+            for i in range(n)
+        ],
+        "meta": {"result_count": n, "next_token": "7140dibdnow9c7btw423x"},
+    }
+
+    response = requests.Response()
+
+    response._content = json.dumps(page).encode()
+
+    response.status_code = 200
+
+    return response
+
+
+def read_page(response) -> None:
+
+    """
+    The reads one pagination step makes against a response.
+    """
+
+    response.json().get("title")
+
+    response.json().get("data")
+
+    response.json()["meta"]["next_token"]
+
+    response.json().get("errors")
+
+
+def main(number: int = 2000) -> None:
+
+    raw = make_page()
+
+    before = timeit.timeit(lambda: read_page(raw), number=number) / number
+
+    after = (
+        timeit.timeit(lambda: read_page(web_tools.Twitter_Response(raw)), number=number)
+        / number
+    )
+
+    backend = "orjson" if web_tools.orjson is not None else "json"
+
+    print(f"page size: {len(raw.content)} bytes, backend: {backend}")
+
+    print(f"before: {before * 1e6:.1f} us/page")
+
+    print(f"after:  {after * 1e6:.1f} us/page ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+
+    main()
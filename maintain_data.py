@@ -0,0 +1,66 @@
+import argparse
+
+import pandas
+
+import web_tools
+
+"""
+Command-line maintenance for the data/ directory: deduplicate, expire old query captures, merge per-user databases into shards, VACUUM and ANALYZE, and report the space reclaimed.
+
+$: python maintain_data.py --retention-days 90 --shards 16
+"""
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compact the Web Tools data store.")
+
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=None,
+        help="Delete query captures older than this. Default: keep everything.",
+    )
+
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Merge data/{id}.db files into this many shards under data/shards.",
+    )
+
+    parser.add_argument(
+        "--keep-originals",
+        action="store_true",
+        help="Keep each data/{id}.db after merging it into its shard.",
+    )
+
+    parser.add_argument(
+        "--no-vacuum", action="store_true", help="Skip VACUUM and ANALYZE."
+    )
+
+    args = parser.parse_args()
+
+    report = web_tools.Database_Functions().maintain(
+        retention_days=args.retention_days,
+        shards=args.shards,
+        keep_originals=args.keep_originals,
+        vacuum=not args.no_vacuum,
+    )
+
+    with pandas.option_context("display.max_rows", None, "display.width", 160):
+
+        print(report.to_string(index=False))
+
+    print(
+        f"\n{len(report)} files, "
+        f"{report['deduplicated'].sum()} duplicates deleted, "
+        f"{report['expired'].sum()} captures expired, "
+        f"{report['merged'].sum()} rows merged, "
+        f"{report['reclaimed'].sum() / 2**20:.1f} MiB reclaimed"
+    )
+
+
+if __name__ == "__main__":
+
+    main()
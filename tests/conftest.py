@@ -0,0 +1,173 @@
+import json
+import re
+import time
+import urllib.parse
+
+import pytest
+import requests
+
+import web_tools
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+
+    """
+    An empty data/ directory as the working directory, with its own database catalog, and the engines opened on it disposed afterwards.
+    """
+
+    monkeypatch.chdir(tmp_path)
+
+    monkeypatch.setattr(web_tools, "catalog", web_tools.Database_Catalog())
+
+    (tmp_path / "data").mkdir()
+
+    yield tmp_path
+
+    web_tools.engines.dispose_all()
+
+
+class Fake_Api:
+
+    """
+    Stands in for api.twitter.com. Serves `records[kind]` (kind: tweets, following, followers, query) newest first in pages of `page_size`, honouring since_id and pagination_token. reply() queues a canned response for the next URL containing a string.
+    """
+
+    def __init__(self):
+
+        self.records = {}
+
+        self.page_size = 10
+
+        self.calls = []
+
+        self.replies = []
+
+    def reply(self, match: str, payload: dict, status: int = 200, headers: dict = None):
+
+        self.replies.append((match, payload, status, headers or {}))
+
+    def route(self, url: str) -> dict:
+
+        parsed = urllib.parse.urlparse(url)
+
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+
+        if "/users/by/username/" in parsed.path:
+
+            name = parsed.path.rsplit("/", 1)[1]
+
+            return {
+                "data": {
+                    "id": str(sum(map(ord, name))),
+                    "username": name,
+                    "public_metrics": {"followers_count": 0, "tweet_count": 0},
+                }
+            }
+
+        if parsed.path.endswith("/tweets/search/recent"):
+
+            kind = "query"
+
+        else:
+
+            kind = re.search(r"/users/\d+/(\w+)$", parsed.path).group(1)
+
+        records = [
+            i
+            for i in self.records.get(kind, [])
+            if int(i["id"]) > int(query.get("since_id", 0))
+        ]
+
+        page = int(query.get("pagination_token", 0))
+
+        data = records[page * self.page_size : (page + 1) * self.page_size]
+
+        meta = {"result_count": len(data)}
+
+        if (page + 1) * self.page_size < len(records):
+
+            meta["next_token"] = str(page + 1)
+
+        return {"data": data, "meta": meta} if data else {"meta": meta}
+
+    def __call__(self, method: str, url: str, **kwargs):
+
+        self.calls.append(url)
+
+        headers = {
+            "x-rate-limit-remaining": "100",
+            "x-rate-limit-limit": "100",
+            "x-rate-limit-reset": str(int(time.time()) + 900),
+            "x-transaction-id": f"tx{len(self.calls)}",
+        }
+
+        for i, (match, payload, status, extra) in enumerate(self.replies):
+
+            if match in url:
+
+                del self.replies[i]
+
+                break
+
+        else:
+
+            payload, status, extra = self.route(url), 200, {}
+
+        response = requests.Response()
+
+        response._content = json.dumps(payload).encode()
+
+        response.status_code = status
+
+        response.headers = requests.structures.CaseInsensitiveDict({**headers, **extra})
+
+        response.url = url
+
+        return response
+
+
+@pytest.fixture
+def api(store, monkeypatch):
+
+    """
+    A Fake_Api behind every requests.Session, and a Twitter_Session with a token.
+    """
+
+    fake = Fake_Api()
+
+    monkeypatch.setattr(
+        requests.Session, "request", lambda self, *args, **kwargs: fake(*args, **kwargs)
+    )
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.token = "token"
+
+    fake.session = t1
+
+    return fake
+
+
+def tweets(first: int, n: int) -> list:
+
+    """
+    n tweet records with ids counting down from `first`, as the v2 API returns them.
+    """
+
+    return [
+        {
+            "id": str(first - i),
+            "text": f"Therefore no more turn me to him, sweet Nan. {i}",
+            "created_at": f"2022-10-{1 + i % 28:02d}T12:00:00.000Z",
+            "author_id": "7",
+            "edit_history_tweet_ids": [str(first - i)],
+            "public_metrics": {
+                "retweet_count": i,
+                "reply_count": 0,
+                "like_count": 2 * i,
+                "quote_count": 0,
+            },
+        }
+        for i in range(n)
+    ]
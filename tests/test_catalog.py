@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+import web_tools
+
+
+@pytest.fixture
+def user_db(store):
+
+    conn = sqlite3.connect(store / "data" / "44196397.db")
+
+    conn.execute("CREATE TABLE tweets (id TEXT, text TEXT)")
+
+    conn.execute("INSERT INTO tweets VALUES ('1', 'sweet Nan')")
+
+    conn.commit()
+
+    conn.close()
+
+    return store
+
+
+def journal_mode(path) -> str:
+
+    conn = sqlite3.connect(path)
+
+    try:
+
+        return conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+    finally:
+
+        conn.close()
+
+
+def test_refresh_leaves_files_unchanged(user_db):
+
+    catalog = web_tools.Database_Catalog()
+
+    tables = catalog.refresh()
+
+    assert tables == {
+        "data/44196397.db": {
+            "tweets": {"rows": 1, "columns": {"id": "TEXT", "text": "TEXT"}}
+        }
+    }
+
+    assert journal_mode(user_db / "data" / "44196397.db") == "delete"
+
+    assert catalog.entries["data/44196397.db"]["signature"] is not None
+
+
+def test_refresh_skips_unchanged_files(user_db, monkeypatch):
+
+    web_tools.Database_Catalog().refresh()
+
+    catalog = web_tools.Database_Catalog()
+
+    scanned = []
+
+    scan = catalog._scan
+
+    monkeypatch.setattr(
+        catalog, "_scan", lambda file: scanned.append(file) or scan(file)
+    )
+
+    catalog.refresh()
+
+    assert scanned == []
@@ -0,0 +1,72 @@
+import pytest
+
+import web_tools
+from conftest import tweets
+
+
+def test_resume_replays_checkpointed_pages(api):
+
+    api.records["tweets"] = tweets(1585000000000000100, 25)
+
+    api.reply("pagination_token=2", {"title": "Unauthorized"}, status=401)
+
+    df = api.session.get_user_tweets("44196397", checkpoint=True)
+
+    assert len(df) == 20
+
+    next_token, pages = api.session.checkpoints.load("user_tweets/44196397")
+
+    assert next_token == "2"
+
+    assert [len(i) for i in pages] == [10, 10]
+
+    calls = len(api.calls)
+
+    df = api.session.get_user_tweets("44196397", resume=True)
+
+    assert api.calls[calls:] == [
+        "https://api.twitter.com/2/users/44196397/tweets?tweet.fields=created_at,text,public_metrics&max_results=100&pagination_token=2"
+    ]
+
+    assert df["id"].tolist() == [i["id"] for i in tweets(1585000000000000100, 25)]
+
+    assert api.session.checkpoints.load("user_tweets/44196397") is None
+
+
+def test_crawl_without_resume_discards_checkpoint(api):
+
+    api.records["followers"] = [
+        {"id": str(i), "username": f"u{i}"} for i in range(1, 26)
+    ]
+
+    api.reply("pagination_token=1", {"title": "Unauthorized"}, status=401)
+
+    assert len(api.session.get_user_followers("44196397", checkpoint=True)) == 10
+
+    assert api.session.checkpoints.load("user_followers/44196397") is not None
+
+    calls = len(api.calls)
+
+    assert len(api.session.get_user_followers("44196397", checkpoint=True)) == 25
+
+    assert len(api.calls) - calls == 3
+
+    assert api.session.checkpoints.load("user_followers/44196397") is None
+
+
+def test_usage_cap_on_the_first_page(api):
+
+    api.records["followers"] = [
+        {"id": str(i), "username": f"u{i}"} for i in range(1, 6)
+    ]
+
+    for call in (
+        lambda: api.session.get_user_followers("44196397"),
+        lambda: api.session.get_string_query("china"),
+    ):
+
+        api.reply("/", {"title": "UsageCapExceeded", "detail": "Usage cap exceeded"})
+
+        with pytest.raises(web_tools.UsageCapExceeded):
+
+            call()
@@ -0,0 +1,43 @@
+import pandas
+import pytest
+
+import web_tools
+from test_storage import tweet_records
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "parquet"])
+def test_start_and_end(store, backend):
+
+    if backend == "parquet":
+
+        pytest.importorskip("pyarrow")
+
+    t1 = web_tools.Twitter_Session(backend=backend)
+
+    records = tweet_records(n=4)
+
+    for i, day in enumerate(("2022-10-01", "2022-10-02", "2022-10-03", "2022-10-04")):
+
+        records[i]["created_at"] = f"{day}T12:00:00.000Z"
+
+    t1.df_to_db("10", pandas.DataFrame(records), "tweets")
+
+    df = t1.db_to_df(
+        "10",
+        "tweets",
+        start="2022-10-02",
+        end="2022-10-04",
+        time_column="created_at",
+    )
+
+    assert sorted(df["id"]) == [int(i["id"]) for i in records[1:3]]
+
+    now = pandas.Timestamp.now()
+
+    for start, end, rows in (
+        (now - pandas.Timedelta(hours=1), None, 4),
+        (now + pandas.Timedelta(hours=1), None, 0),
+        (None, now - pandas.Timedelta(hours=1), 0),
+    ):
+
+        assert len(t1.db_to_df("10", "tweets", start=start, end=end)) == rows
@@ -0,0 +1,83 @@
+import os
+
+import pandas
+import pytest
+
+import web_tools
+from test_storage import tweet_records
+
+pytest.importorskip("pyarrow")
+
+
+def test_parquet_round_trip(store):
+
+    t1 = web_tools.Twitter_Session(backend="parquet")
+
+    t1.df_to_db("1585000000000000999", pandas.DataFrame(tweet_records()), "tweets")
+
+    t1.df_to_db("10", pandas.DataFrame(tweet_records(n=2)), "tweets")
+
+    df = t1.db_to_df("1585000000000000999", "tweets")
+
+    assert sorted(df["id"]) == [int(i["id"]) for i in tweet_records()]
+
+    assert set(df["user_id"]) == {"1585000000000000999"}
+
+    assert sorted(df["like_count"]) == [0, 2, 4]
+
+    assert len(t1.db_to_df(None, "tweets")) == 5
+
+    assert list(t1.db_to_df("10", "tweets", columns=["id", "text"]).columns) == [
+        "id",
+        "text",
+    ]
+
+    assert not os.path.exists("data/10.db")
+
+
+def test_parquet_reads_unify_added_columns(store):
+
+    t1 = web_tools.Twitter_Session(backend="parquet")
+
+    records = tweet_records(n=2)
+
+    t1.df_to_db("10", pandas.DataFrame(records[:1]), "tweets")
+
+    t1.df_to_db("10", pandas.DataFrame(records[1:]), "tweets")
+
+    df = t1.db_to_df("10", "tweets").sort_values("id")
+
+    assert len(df) == 2
+
+    assert df["entities"].isna().tolist() == [True, False]
+
+
+def test_parquet_query_filters_and_chunks(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    for i, term in enumerate(("china", "sweet nan")):
+
+        t1.df_to_db(
+            f"tx{i}",
+            pandas.DataFrame(tweet_records(first=1585000000000000001 + 10 * i)),
+            "query",
+            query_term=term,
+            backend="parquet",
+        )
+
+    df = t1.db_to_df(None, "query", query_term="sweet nan", backend="parquet")
+
+    assert set(df["transaction_id"]) == {"tx1"}
+
+    assert len(t1.db_to_df("tx0", "query", backend="parquet")) == 3
+
+    df = t1.db_to_df(None, "query", since_id=1585000000000000012, backend="parquet")
+
+    assert df["id"].tolist() == [1585000000000000013]
+
+    chunks = list(t1.db_to_df(None, "query", chunksize=2, backend="parquet"))
+
+    assert sum(len(i) for i in chunks) == 6
+
+    assert max(len(i) for i in chunks) <= 2
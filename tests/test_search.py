@@ -0,0 +1,59 @@
+import pandas
+
+import web_tools
+
+
+def capture(first: int, authors: bool) -> pandas.DataFrame:
+
+    """
+    A page of search results, with or without the author_id field.
+    """
+
+    return pandas.DataFrame(
+        [
+            {
+                "id": str(first + i),
+                "text": f"semiconductor supply chain {i}",
+                "edit_history_tweet_ids": [str(first + i)],
+                **({"author_id": str(7 + i % 2)} if authors else {}),
+            }
+            for i in range(4)
+        ]
+    )
+
+
+def test_search_by_user_skips_captures_without_authors(store):
+
+    web_tools.Twitter_Session().df_to_db(
+        "tx1", capture(100, authors=False), "query", query_term="taiwan"
+    )
+
+    df = web_tools.Database_Functions().search("semiconductor", user_id="7")
+
+    assert len(df) == 0
+
+    assert len(web_tools.Database_Functions().search("semiconductor")) == 4
+
+
+def test_search_by_user_filters_query_authors(store):
+
+    web_tools.Twitter_Session().df_to_db(
+        "tx1", capture(100, authors=True), "query", query_term="taiwan"
+    )
+
+    df = web_tools.Database_Functions().search("semiconductor", user_id="7")
+
+    assert len(df) == 2
+
+    assert set(df["author_id"]) == {7}
+
+
+def test_search_by_time_skips_captures_without_dates(store):
+
+    web_tools.Twitter_Session().df_to_db(
+        "tx1", capture(100, authors=True), "query", query_term="taiwan"
+    )
+
+    df = web_tools.Database_Functions().search("supply", start="2022-11-01")
+
+    assert len(df) == 0
@@ -0,0 +1,24 @@
+import web_tools
+from conftest import tweets
+
+
+def user_id(username: str) -> str:
+
+    return str(sum(map(ord, username)))
+
+
+def test_snapshot_many_keeps_other_users(api):
+
+    api.records["tweets"] = tweets(1585000000000000100, 3)
+
+    api.reply(f"/users/{user_id('bob')}/tweets", {"title": "UsageCapExceeded"})
+
+    snapshots = api.session.get_user_snapshots(["@alice", "bob"])
+
+    assert list(snapshots) == ["@alice"]
+
+    assert len(snapshots["@alice"]["tweets"]) == 3
+
+    assert isinstance(api.session.snapshot_errors["bob"], web_tools.UsageCapExceeded)
+
+    assert len(api.session.db_to_df(user_id("alice"), "tweets")) == 3
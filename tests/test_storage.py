@@ -0,0 +1,319 @@
+import concurrent.futures
+import datetime
+import json
+import os
+
+import pandas
+import sqlalchemy
+
+import web_tools
+
+
+def tweet_records(first: int = 1585000000000000001, n: int = 3) -> list:
+
+    """
+    Tweets as the v2 API returns them: every tweet carries edit_history_tweet_ids, a list, and some carry nested entities.
+    """
+
+    return [
+        {
+            "id": str(first + i),
+            "text": f"Therefore no more turn me to him, sweet Nan. {i}",
+            "created_at": "2022-10-29T12:00:00.000Z",
+            "edit_history_tweet_ids": [str(first + i)],
+            "public_metrics": {
+                "retweet_count": i,
+                "reply_count": 0,
+                "like_count": 2 * i,
+                "quote_count": 0,
+            },
+            **({"entities": {"hashtags": [{"tag": "nan"}]}} if i % 2 else {}),
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_write(path: str, table: str, data: pandas.DataFrame) -> None:
+
+    """
+    Write a frame the way the original df_to_db() did: every column as text.
+    """
+
+    data.insert(0, "capture_timestamp", datetime.datetime.now())
+
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+
+    data.astype("str").to_sql(name=table, con=engine, if_exists="append", index=False)
+
+    engine.dispose()
+
+
+def test_df_to_db_stores_list_columns_as_json(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.df_to_db("44196397", pandas.DataFrame(tweet_records()), "tweets")
+
+    t1.df_to_db("tx1", pandas.DataFrame(tweet_records()), "query", query_term="nan")
+
+    df = t1.db_to_df("44196397", "tweets")
+
+    assert len(df) == 3
+
+    assert [json.loads(i) for i in df["edit_history_tweet_ids"]] == [
+        [i["id"]] for i in tweet_records()
+    ]
+
+    assert json.loads(df["entities"][1]) == {"hashtags": [{"tag": "nan"}]}
+
+    assert len(t1.db_to_df("tx1", "query")) == 3
+
+
+def test_migrate_storage_reads_baseline_tables(store):
+
+    legacy_write("data/44196397.db", "tweets", pandas.DataFrame(tweet_records()))
+
+    report = web_tools.Database_Functions().migrate_storage(["data/44196397.db"])
+
+    assert report == [("data/44196397.db", "tweets", "tweets", 3)]
+
+    df = web_tools.Twitter_Session().db_to_df("44196397", "tweets")
+
+    assert df["like_count"].tolist() == [0, 2, 4]
+
+    assert json.loads(df["edit_history_tweet_ids"][0]) == [tweet_records()[0]["id"]]
+
+
+def test_migrate_storage_skips_typed_tables(store):
+
+    legacy_write("data/44196397.db", "tweets", pandas.DataFrame(tweet_records()))
+
+    web_tools.Twitter_Session().df_to_db(
+        "10", pandas.DataFrame(tweet_records()), "tweets"
+    )
+
+    files = ["data/44196397.db", "data/10.db"]
+
+    assert web_tools.Database_Functions().migrate_storage(files) == [
+        ("data/44196397.db", "tweets", "tweets", 3)
+    ]
+
+    assert web_tools.Database_Functions().migrate_storage(files) == []
+
+
+def test_migrate_storage_indexes_query_results(store):
+
+    df = pandas.DataFrame(tweet_records())
+
+    df.insert(0, "query_term", "china")
+
+    legacy_write("data/twitter_queries.db", web_tools.query_table, df)
+
+    web_tools.Database_Functions().migrate_storage(["data/twitter_queries.db"])
+
+    indexes = sqlalchemy.inspect(
+        web_tools.engines.get("data/twitter_queries.db")
+    ).get_indexes(web_tools.query_table)
+
+    assert set(web_tools._query_indexes) <= {i["name"] for i in indexes}
+
+
+def test_migrate_query_tables_moves_baseline_tables(store):
+
+    for table, term in (("1a2b3c", "china"), ("4d5e6f", "sweet")):
+
+        df = pandas.DataFrame(tweet_records())
+
+        df.insert(0, "query_term", term)
+
+        legacy_write("data/twitter_queries.db", table, df)
+
+    report = web_tools.Database_Functions().migrate_query_tables()
+
+    assert sorted(report) == [("1a2b3c", 3), ("4d5e6f", 3)]
+
+    df = web_tools.Twitter_Session().db_to_df("1a2b3c", "query")
+
+    assert len(df) == 3
+
+    assert set(df["query_term"]) == {"china"}
+
+    assert json.loads(df["edit_history_tweet_ids"][0]) == [tweet_records()[0]["id"]]
+
+    tables = sqlalchemy.inspect(web_tools.engines.get("data/twitter_queries.db"))
+
+    assert web_tools.query_table in tables.get_table_names()
+
+    assert "1a2b3c" not in tables.get_table_names()
+
+
+def test_concurrent_first_query_writes(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.token = "token"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+
+        futures = [
+            pool.submit(
+                t1._spawn().df_to_db,
+                f"tx{i}",
+                pandas.DataFrame(tweet_records(first=1585000000000000001 + 10 * i)),
+                "query",
+                query_term=f"term{i}",
+            )
+            for i in range(4)
+        ]
+
+    for i in futures:
+
+        i.result()
+
+    df = pandas.read_sql_query(
+        f"SELECT COUNT(*) AS n FROM {web_tools.query_table}",
+        web_tools.engines.get("data/twitter_queries.db"),
+    )
+
+    assert df["n"][0] == 12
+
+
+def test_write_locks_follow_evicted_engines(store):
+
+    registry = web_tools.Engine_Registry(size=2)
+
+    for i in range(5):
+
+        with registry.write_lock(registry.get(f"data/{i}.db")):
+
+            registry.get(f"data/{i + 10}.db")
+
+            registry.get(f"data/{i + 20}.db")
+
+            assert len(registry._writers) == 1
+
+    assert len(registry._writers) <= 2
+
+    assert set(registry._writers) <= set(registry._engines)
+
+    registry.dispose_all()
+
+    assert registry._writers == {}
+
+
+def test_maintain_shards_list_columns(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    for user in ("10", "11", "12"):
+
+        t1.df_to_db(user, pandas.DataFrame(tweet_records()), "tweets")
+
+    legacy_write("data/13.db", "tweets", pandas.DataFrame(tweet_records()))
+
+    report = web_tools.Database_Functions().maintain(shards=2)
+
+    assert report.set_index("file").loc["data/13.db", "merged"] == 3
+
+    assert web_tools._shard_files() == [
+        os.path.join("data/shards", "000-of-002.db"),
+        os.path.join("data/shards", "001-of-002.db"),
+    ]
+
+    assert not any(os.path.exists(f"data/{i}.db") for i in ("10", "11", "12", "13"))
+
+    for user in ("10", "11", "12", "13"):
+
+        df = t1.db_to_df(user, "tweets")
+
+        assert df["id"].tolist() == [int(i["id"]) for i in tweet_records()]
+
+        assert json.loads(df["edit_history_tweet_ids"][0]) == [df["id"][0].astype(str)]
+
+    assert len(web_tools.Database_Functions().search("Nan", user_id="13")) == 3
+
+
+def test_maintain_keeps_originals(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.df_to_db("10", pandas.DataFrame(tweet_records()), "tweets")
+
+    t1.df_to_db("10", pandas.DataFrame([{"id": "10", "username": "nan"}]), "profile")
+
+    for i in range(2):
+
+        web_tools.Database_Functions().maintain(shards=2, keep_originals=True)
+
+    assert os.path.exists("data/10.db")
+
+    assert len(t1.db_to_df("10", "tweets")) == 3
+
+    shard = web_tools.engines.get("data/shards/000-of-002.db")
+
+    for table, rows in (("tweets", 3), ("profile", 1)):
+
+        df = pandas.read_sql_query(f'SELECT COUNT(*) AS n FROM "{table}"', shard)
+
+        assert df["n"][0] == rows
+
+
+def tweet_counts(sql: str = "SELECT COUNT(*) AS n FROM {db}.tweets") -> dict:
+
+    """
+    query_users() over every user, as {user_id: n}.
+    """
+
+    df = pandas.concat(web_tools.Database_Functions().query_users(sql))
+
+    return dict(zip(df["user_id"], df["n"]))
+
+
+def test_kept_originals_are_counted_once(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.df_to_db("10", pandas.DataFrame(tweet_records()), "tweets")
+
+    web_tools.Database_Functions().maintain(shards=2, keep_originals=True)
+
+    t1.df_to_db(
+        "10", pandas.DataFrame(tweet_records(first=1585000000000000101, n=2)), "tweets"
+    )
+
+    assert tweet_counts() == {"10": 5}
+
+    assert len(web_tools.Database_Functions().search("Nan")) == 5
+
+    assert len(web_tools.Database_Functions().search("Nan", user_id="10")) == 5
+
+
+def test_writes_after_a_merge_are_counted_once(store):
+
+    t1 = web_tools.Twitter_Session()
+
+    for user in ("10", "11"):
+
+        t1.df_to_db(user, pandas.DataFrame(tweet_records()), "tweets")
+
+        t1.df_to_db(
+            user, pandas.DataFrame([{"id": user, "username": "nan"}]), "profile"
+        )
+
+    web_tools.Database_Functions().maintain(shards=2)
+
+    t1.df_to_db(
+        "10", pandas.DataFrame(tweet_records(first=1585000000000000002)), "tweets"
+    )
+
+    t1.df_to_db("10", pandas.DataFrame([{"id": "10", "username": "nan"}]), "profile")
+
+    assert os.path.exists("data/10.db")
+
+    assert tweet_counts() == {"10": 4, "11": 3}
+
+    assert tweet_counts("SELECT COUNT(*) AS n FROM {db}.profile") == {"10": 2, "11": 1}
+
+    assert len(t1.db_to_df("10", "tweets")) == 4
+
+    assert len(web_tools.Database_Functions().search("Nan")) == 7
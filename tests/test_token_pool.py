@@ -0,0 +1,73 @@
+import json
+import time
+
+import web_tools
+
+
+def limits(remaining: int, reset_at: float) -> dict:
+
+    return {"remaining": remaining, "limit": 900, "reset_at": reset_at}
+
+
+def test_acquire_ranks_by_remaining_budget():
+
+    t1 = web_tools.Token_Pool(["a", "b", "c", "a"])
+
+    assert t1.tokens == ["a", "b", "c"]
+
+    reset_at = time.time() + 900
+
+    t1.schedulers["a"].update("user_tweets", limits(5, reset_at))
+
+    t1.schedulers["b"].update("user_tweets", limits(50, reset_at))
+
+    assert t1.acquire("user_tweets") == "c"
+
+    t1.schedulers["c"].update("user_tweets", limits(10, reset_at))
+
+    assert t1.acquire("user_tweets") == "b"
+
+    assert t1.acquire("user_followers") == "a"
+
+
+def test_spent_tokens_rotate_out_until_reset():
+
+    t1 = web_tools.Token_Pool(["a", "b"])
+
+    now = time.time()
+
+    t1.schedulers["a"].update("user_tweets", limits(0, now + 900))
+
+    t1.schedulers["b"].update("user_tweets", limits(1, now + 900))
+
+    assert t1.acquire("user_tweets") == "b"
+
+    t1.schedulers["b"].update("user_tweets", limits(0, now + 300))
+
+    assert t1.acquire("user_tweets") == "b"
+
+    t1.schedulers["a"].update("user_tweets", limits(0, now - 1))
+
+    assert t1.acquire("user_tweets") == "a"
+
+
+def test_session_loads_pool(tmp_path):
+
+    path = tmp_path / "keys.json"
+
+    path.write_text(
+        json.dumps({"keys": [{"Bearer Token": "a"}, {"Bearer Token": "b"}]})
+    )
+
+    t1 = web_tools.Twitter_Session()
+
+    t1.get_token_pool(str(path))
+
+    assert t1.pool.tokens == ["a", "b"]
+
+    assert t1.token == "a"
+
+    assert set(t1.pool.limit_log) == {
+        web_tools._token_id("a"),
+        web_tools._token_id("b"),
+    }
@@ -0,0 +1,61 @@
+import datetime
+
+import web_tools
+
+
+def ledger(tmp_path, **kwargs):
+
+    return web_tools.Usage_Ledger(
+        path=str(tmp_path / "usage_ledger.db"), enrollment="29 October", **kwargs
+    )
+
+
+def test_forecast_after_rollover_does_not_exhaust(tmp_path):
+
+    t1 = ledger(tmp_path, cap=500000)
+
+    t1.record("query", 100)
+
+    now = t1.period()[0] + datetime.timedelta(seconds=30)
+
+    forecast = t1.forecast(now)
+
+    assert forecast["consumed"] == 100
+
+    assert forecast["exhausted_at"] is None
+
+    assert forecast["projected"] < t1.cap
+
+
+def test_allowed_after_rollover(tmp_path, monkeypatch):
+
+    t1 = ledger(tmp_path, cap=500000, reserve_priority=0)
+
+    t1.record("query", 100)
+
+    start = t1.period()[0]
+
+    forecast = t1.forecast
+
+    monkeypatch.setattr(
+        t1,
+        "forecast",
+        lambda now=None: forecast(start + datetime.timedelta(seconds=30)),
+    )
+
+    assert t1.allowed(priority=5)
+
+
+def test_forecast_exhausts_at_a_sustained_rate(tmp_path):
+
+    t1 = ledger(tmp_path, cap=1000)
+
+    t1.record("user_tweets", 900)
+
+    now = t1.period()[0] + datetime.timedelta(days=2)
+
+    forecast = t1.forecast(now)
+
+    assert forecast["exhausted_at"] is not None
+
+    assert forecast["exhausted_at"] < forecast["period_end"]
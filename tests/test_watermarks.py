@@ -0,0 +1,79 @@
+import pytest
+
+import web_tools
+from conftest import tweets
+
+
+def poll(api, **kwargs) -> None:
+
+    df = api.session.get_string_query("china", incremental=True, **kwargs)
+
+    if len(df):
+
+        api.session.df_to_db(
+            api.session.query_log[len(api.session.query_log) - 1]["x-transaction-id"],
+            df,
+            "query",
+            query_term="china",
+        )
+
+
+def test_mark_advances_once_the_capture_is_stored(api):
+
+    api.records["query"] = tweets(1585000000000000100, 5)
+
+    df = api.session.get_string_query("china", incremental=True)
+
+    assert api.session.watermarks.get("china") is None
+
+    assert api.session.pending_watermarks == {"china": ("china", "1585000000000000100")}
+
+    api.session.df_to_db("tx1", df, "query", query_term="china")
+
+    assert api.session.pending_watermarks == {}
+
+    assert api.session.watermarks.get("china") == "1585000000000000100"
+
+
+def test_truncated_poll_keeps_the_old_mark(api):
+
+    api.session.watermarks.set("china", "1585000000000000050")
+
+    api.records["query"] = tweets(1585000000000000100, 60)
+
+    poll(api, pages=2)
+
+    assert api.calls[0].endswith("&since_id=1585000000000000050")
+
+    assert api.session.watermarks.get("china") == "1585000000000000050"
+
+    poll(api, pages=5)
+
+    assert api.session.watermarks.get("china") == "1585000000000000100"
+
+
+def test_failed_write_behind_keeps_the_old_mark(api, monkeypatch):
+
+    api.session.watermarks.set("china", "1585000000000000050")
+
+    api.records["query"] = tweets(1585000000000000100, 20)
+
+    api.session.enable_write_behind(linger=0)
+
+    def fail(*args):
+
+        raise OSError("disk full")
+
+    monkeypatch.setattr(web_tools, "_write", fail)
+
+    poll(api, pages=5)
+
+    assert api.session.pending_watermarks == {}
+
+    with pytest.raises(OSError):
+
+        api.session.flush()
+
+    api.session.close()
+
+    assert api.session.watermarks.get("china") == "1585000000000000050"
@@ -1,17 +1,51 @@
+import ast
+import asyncio
+import atexit
+import calendar
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import functools
 import glob
+import hashlib
+import itertools
 import json
+import os
 import pickle
+import queue
 import random
 import re
+import signal
+import sqlite3
 import sys
+import threading
 import time
 import urllib.parse
+import uuid
 from dataclasses import dataclass
 
 import pandas
 import requests
 import sqlalchemy
+import sqlalchemy.dialects.sqlite
+
+try:
+
+    import orjson
+
+except ImportError:
+
+    orjson = None
+
+try:
+
+    import pyarrow
+    import pyarrow.dataset
+
+except ImportError:
+
+    pyarrow = None
 
 """
 I'm using pdoc to write the API documentation.
@@ -19,945 +53,5490 @@ $: pdoc ./web_tools.py -o ./documentation/
 """
 
 
-@dataclass
-class Twitter_Session:
+class UsageCapExceeded(Exception):
 
     """
-    A Twitter session object.
-
-    #### Parameters
+    Raised when Twitter reports the monthly tweet cap has been reached.
+    """
 
-        token : str - The bearer token for public metrics. Acquired via a Twitter developer account. Use the get_token_local() method to set.
 
-    #### Attributes
+class Engine_Registry:
 
-        token : str - The bearer token for this instance.
+    """
+    Process-wide SQLAlchemy engines, one per database path.
 
-        session : object - The requests.Session object for this instance.
+    Engines are created on first use and reused by every reader and writer of the same file, so their connection pools survive across df_to_db() and db_to_df() calls. The registry holds at most `size` engines; the least recently used is disposed when a new one is needed. Every engine is disposed at interpreter exit.
 
-        history : list - History of URL calls made by this instance.
+    Every connection is opened with `pragmas`. WAL journaling lets readers such as app.py query a file while a crawl is writing to it.
 
-        limit_log : dict - Metrics parsed from Twitter response headers. Used to set metrics trackers by the application.
+    #### Parameters
 
-        query_log : dict - Log of queries made. Primarily used to find session query terms.
+        size : int - Maximum number of open engines. Default 64.
     """
 
-    twitter_enrollment_period = "29 October"
+    pragmas = {
+        "busy_timeout": 10000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+    }
+    """PRAGMA statements run on every new connection, in order. busy_timeout comes first so switching to WAL waits out another connection's lock instead of failing. synchronous=NORMAL is safe under WAL; a power loss can only drop the last commits."""
 
-    def __init__(self):
+    def __init__(self, size: int = 64):
+
+        self.size = size
+
+        self._engines = collections.OrderedDict()
+
+        self._writers = {}
+
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> sqlalchemy.engine.Engine:
 
         """
-        Instantiate the session object. Requires no parameters.
+        Return the engine for a SQLite database file, creating it if needed.
         """
 
-        self.session = requests.Session()
-        """Creates a request.session object unique to the instance."""
+        key = os.path.abspath(path)
 
-        self.response = ""
-        """The last requests.response object received."""
+        with self._lock:
 
-        self.limit_log = {}
-        """The log of Twitter server rates and limits. Appended as the endpoint is accessed. Refer: https://developer.twitter.com/en/docs/twitter-api/rate-limits"""
+            engine = self._engines.get(key)
 
-        self.query_log = {}
-        """The log of Twitter queries and responses. Use to reference the transaction id, search term, etc."""
+            if engine is not None:
 
-    def get_token_local(self, path: str) -> None:
+                self._engines.move_to_end(key)
 
-        """
-        Retreive a Twitter bearer token from a JSON with the following schema:
+                return engine
 
-            {'keys':
+            engine = sqlalchemy.create_engine(f"sqlite:///{key}")
 
-                'Bearer Token': 'token'
+            sqlalchemy.event.listen(engine, "connect", self._on_connect)
 
-                }
+            self._engines[key] = engine
 
-        #### Parameters
+            while len(self._engines) > self.size:
 
-            path : str - File path to the JSON. Must be accessible with open(), and readable by read().
+                evicted, old = self._engines.popitem(last=False)
 
-        #### Attributes
+                self._forget_writer(evicted)
 
-            self.token : str - The bearer token string.
-        """
+                old.dispose()
 
-        with open(file=path, mode="r") as file:
+            return engine
 
-            temp = json.loads(file.read())
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
 
-            self.token = temp["keys"]["Bearer Token"]
-            """This session's bearer token. Acquired from a Twitter developer account. Refer: https://developer.twitter.com/en/docs/twitter-api/getting-started/getting-access-to-the-twitter-api"""
+        cursor = dbapi_connection.cursor()
 
-    def get_url(self, url: str) -> None:
+        for name, value in self.pragmas.items():
 
-        """
-        Simple HTTP GET request.
+            cursor.execute(f"PRAGMA {name} = {value}")
 
-        #### Parameters
+        cursor.close()
 
-            url : str - The complete URL, with or without a scheme. If no scheme is specified, defaults to 'https://'.
+    @contextlib.contextmanager
+    def write_lock(self, engine: sqlalchemy.engine.Engine):
 
-        #### Attributes
+        """
+        Hold the lock serialising this process's writes to one database, so concurrent first writes do not race to create or alter the same table. SQLite admits one writer at a time anyway.
 
-            self.response : Response - The complete requests.response object, set to the class variable response.
+        Locks are counted by their users and forgotten along with their engine once none is waiting on them, so the registry stays bounded by `size`.
         """
 
-        try:  # try the call
+        key = engine.url.database
 
-            self.response = self.session.get(
-                url, headers={"Authorization": f"Bearer {self.token}"}, stream=False
-            )
+        with self._lock:
 
-        except requests.exceptions.MissingSchema:
+            lock, users = self._writers.get(key, (None, 0))
 
-            self.response = self.session.get(
-                url=f"https://{url}",
-                headers={"Authorization": f"Bearer {self.token}"},
-                stream=False,
-            )
+            lock = lock or threading.Lock()
 
-    def post_url(self, url: str, **kw):
+            self._writers[key] = (lock, users + 1)
 
-        """
-        Simple HTTP POST request.
-        
-        #### Parameters
+        try:
 
-            url : str - The complete URL, with or without a scheme. If no scheme is specified, defaults to 'https://'.
+            with lock:
 
-            optional kwargs : dict - headers, params, json, data
+                yield
 
-        #### Attributes
+        finally:
 
-            self.response : Response - The complete requests.response object, set to the class variable response.
-        """
+            with self._lock:
 
-        try:
+                lock, users = self._writers[key]
 
-            self.response = self.session.post(
-                url,
-                headers=kw.get('oauth', False),
-                params=kw.get('params', False),
-                json=kw.get('json', False),
-                data=kw.get('data', False),
-            )
+                self._writers[key] = (lock, users - 1)
 
-        except requests.exceptions.MissingSchema:
+                if key not in self._engines:
 
-            self.response = self.session.post(
-                url=f"https://{url}",
-                headers=kw.get('oauth', False),
-                params=kw.get('params', False),
-                json=kw.get('json', False),
-                data=kw.get('data', False),
-                stream=False,
-            )
+                    self._forget_writer(key)
 
-    def get_user_profile(self, username: str, **kwargs) -> pandas.DataFrame:
+    def _forget_writer(self, key: str) -> None:
+
+        lock, users = self._writers.get(key, (None, 0))
+
+        if lock is not None and users == 0:
+
+            del self._writers[key]
+
+    def dispose(self, path: str) -> None:
 
         """
-        Request Twitter's users by username endpoint. Resets index.
+        Dispose and forget one database's engine, e.g. before the file is moved or deleted.
+        """
 
-        #### Parameters
+        with self._lock:
 
-            username : str - The @username. Can be passed with or without '@'.
+            engine = self._engines.pop(os.path.abspath(path), None)
 
-            timer : bool
+            self._forget_writer(os.path.abspath(path))
 
-        #### Returns
+        if engine is not None:
 
-            pandas.DataFrame - A parsed DataFrame generated from the response JSON.
+            engine.dispose()
+
+    def dispose_all(self) -> None:
+
+        """
+        Dispose every engine.
         """
 
-        if "timer" in kwargs.keys():
+        with self._lock:
 
-            timer = kwargs["timer"]
+            engines = list(self._engines.values())
 
-        else:
+            self._engines.clear()
 
-            timer = False
+            for key in list(self._writers):
 
-        if timer is True:
+                self._forget_writer(key)
 
-            print("sleeping...-_-...")
+        for engine in engines:
 
-            time.sleep(59)
+            engine.dispose()
 
-        if username[0] == "@":
 
-            username = username[1:]
+engines = Engine_Registry()
+"""The process-wide engine registry."""
 
-        self.get_url(
-            url=f"https://api.twitter.com/2/users/by/username/{username}?user.fields=description,public_metrics,profile_image_url"
-        )
+atexit.register(engines.dispose_all)
 
-        try:
 
-            self.limit_log["user_profile"] = self.return_server_limits()
+class Twitter_Response:
 
-            self.limit_log["user_profile"]["checked_at"] = datetime.datetime.now()
+    """
+    A requests.Response that decodes its JSON body once.
 
-            df = pandas.DataFrame(data=self.response.json()["data"])
+    The pagination loops read `title`, `data`, `meta.next_token` and `errors` from the same response; json() returns the cached payload after the first call. Decoding uses orjson when it is installed, else the standard library. Every other attribute (headers, status_code, ...) is passed through to the wrapped response.
 
-            df = df.reset_index()
+    #### Parameters
 
-            df = df.rename(columns={"index": "metric"})
+        response : requests.Response - The response to wrap.
 
-            return df
+        cached : bool - Default `False`. Set by Response_Cache on replayed responses.
+    """
 
-        except KeyError:
+    def __init__(self, response: requests.Response, cached: bool = False):
 
-            self.limit_log["user_profile"] = self.return_server_limits()
+        self.raw = response
+        """The wrapped requests.Response."""
 
-            self.limit_log["user_profile"]["checked_at"] = datetime.datetime.now()
+        self.cached = cached
+        """`True` if the response was replayed from a Response_Cache."""
 
-            return pandas.DataFrame(self.response.json()["errors"])
+        self._payload = None
 
-    def get_user_tweets(self, user_id: str, **kwargs):
+        self._decoded = False
+
+    def json(self):
 
         """
-        Get all a user's tweets. This is a costly operation in that Twitter paginates tweets
+        The decoded body. Decoded on the first call, cached for every call after.
+        """
 
-        100 at a time. Due to rate limits, and depending on how many tweets a user has, this
+        if not self._decoded:
 
-        may take a while. Twitter rate epochs reset 15 minutes after the first call has been
+            self._payload = _json_loads(self.raw.content)
 
-        made. The rate limits vary. Refer to the rate limits returned in the headers of this
+            self._decoded = True
 
-        class.
+        return self._payload
 
-        #### Parameters
+    @property
+    def payload(self):
 
-            user_id : str - The Twitter user's id. This is typically a 64-bit unsigned integer. Passed back to the server as a string to avoid accuracy loss. Read more: https://developer.twitter.com/en/docs/twitter-ids
+        """Alias of json()."""
 
-            pages : int - Number of pages to request. Pages are 100 tweets. To get a user's entire profile, check their tweet count, divide by 100, and round up. If pages is not specified, the function will run recursively until all available pages have been retrieved or the rate limit has been reached.
+        return self.json()
 
-            timer : bool
+    def __getattr__(self, name):
 
-        #### Returns
+        return getattr(self.raw, name)
 
-            pandas.DataFrame - The DataFrame with a user's tweets.
 
-        #### Example
+@dataclass
+class Twitter_Session:
 
-            Getting all available user tweets
+    """
+    A Twitter session object.
 
-            `df = t1.get_user_profile('elonmusk')`
-            `df = t1.get_user_tweets(df['id'][0], round(df['tweet_count'][0] / 100))`
-        """
+    #### Parameters
 
-        df = pandas.DataFrame()
+        token : str - The bearer token for public metrics. Acquired via a Twitter developer account. Use the get_token_local() method to set.
 
-        if "pages" in kwargs.keys():
+    #### Attributes
 
-            pages = kwargs["pages"]
+        token : str - The bearer token for this instance.
 
-        else:
+        session : object - The requests.Session object for this instance, configured by the transport.
 
-            pages = 1500
+        transport : Transport - Pool sizing, timeouts, and retry/backoff policy for every request.
 
-        for i in range(pages):
+        history : collections.deque - History of URL calls made by this instance, with status, attempts, and latency. Keeps the last 10,000.
 
-            if i == 0:
+        limit_log : dict - Metrics parsed from Twitter response headers. Used to set metrics trackers by the application.
 
-                self.get_url(
-                    f"https://api.twitter.com/2/users/{user_id}/tweets?tweet.fields=created_at,text,public_metrics&max_results=100"
-                )
+        scheduler : Rate_Limit_Scheduler - Per-endpoint token buckets. Throttles the getters when `timer=True`.
 
-                if self.response.json().get("title"):
+        checkpoints : Crawl_Checkpoints - Crawl cursors and completed pages, stored in data/checkpoints.db. Only used by crawls run with `resume` or `checkpoint`.
 
-                    if self.response.json()["title"] == "UsageCapExceeded":
+        cache : Response_Cache - Optional on-disk cache of GET responses. See enable_cache().
 
-                        raise Exception("Usage cap exceeded for Tweets.")
+        writer : Batch_Writer - Optional write-behind queue for df_to_db(). See enable_write_behind().
 
-                        break
+        backend : str - Default storage for df_to_db() and db_to_df(): 'sqlite' or 'parquet'.
 
-                if self.response.json().get("data"):
+        ledger : Usage_Ledger - Tweets consumed against the monthly cap, stored in data/usage_ledger.db.
 
-                    df = pandas.DataFrame(self.response.json()["data"])
+        watermarks : Query_Watermarks - The newest tweet id stored per query term, kept next to the query store.
 
-            else:
+        pool : Token_Pool - Optional set of bearer tokens rotated per request. See get_token_pool().
 
-                try:
+        query_log : dict - Log of queries made. Primarily used to find session query terms.
+    """
 
-                    next_token = self.response.json()["meta"]["next_token"]
+    twitter_enrollment_period = "29 October"
 
-                    self.get_url(
-                        f"https://api.twitter.com/2/users/{user_id}/tweets?tweet.fields=created_at,text,public_metrics&max_results=100&pagination_token={next_token}"
-                    )
+    monthly_tweet_cap = 500000
+    """Tweets the developer account may pull per billing period. The period renews on the enrollment day of each month."""
 
-                    df2 = pandas.DataFrame(self.response.json()["data"])
+    def __init__(self, **kwargs):
 
-                    df = pandas.concat([df, df2], axis=0)
+        """
+        Instantiate the session object. Requires no parameters.
 
-                except KeyError:
+        #### Parameters
 
-                    break
+            optional kwargs : dict - Transport settings: pool_connections, pool_maxsize, timeout, retries, backoff, backoff_max. See Transport. Also backend, the default storage backend.
+        """
 
-            if kwargs.get("timer", False):
+        self.transport = Transport(**kwargs)
+        """The retry and pooling policy shared with worker sessions."""
 
-                if kwargs["timer"] is True:
+        self.session = self.transport.session()
+        """Creates a request.session object unique to the instance."""
 
-                    print("sleeping...-_-...")
+        self.history = collections.deque(maxlen=10000)
+        """{'timestamp', 'method', 'url', 'status_code', 'attempts', 'latency'} per request made."""
 
-                    time.sleep(59)
+        self.response = ""
+        """The last response received, as a Twitter_Response."""
 
-        try:
+        self.limit_log = {}
+        """The log of Twitter server rates and limits. Appended as the endpoint is accessed. Refer: https://developer.twitter.com/en/docs/twitter-api/rate-limits"""
 
-            df = df.reset_index()
+        self.query_log = {}
+        """The log of Twitter queries and responses. Use to reference the transaction id, search term, etc."""
 
-            df2 = pandas.DataFrame.from_records(df["public_metrics"])
+        self.scheduler = Rate_Limit_Scheduler()
+        """Per-endpoint rate-limit buckets, fed from the limit log. Used by the getters when `timer=True`."""
 
-            self.limit_log["user_tweets"] = self.return_server_limits()
+        self.checkpoints = Crawl_Checkpoints()
+        """Pagination checkpoints for the user timeline, following, and followers crawls."""
 
-            self.limit_log["user_tweets"]["checked_at"] = datetime.datetime.now()
+        self.cache = None
+        """The Response_Cache for get_url(). Default `None`, disabled. Use enable_cache() to opt in."""
 
-            return pandas.concat([df, df2], axis=1).drop(
-                labels=["index", "public_metrics"], axis=1
-            )
+        self.writer = None
+        """The Batch_Writer for df_to_db(). Default `None`, writes are synchronous. Use enable_write_behind() to opt in."""
 
-        except KeyError:
+        self.backend = kwargs.get("backend", "sqlite")
+        """'sqlite' (default) or 'parquet', the columnar store under data/parquet. Requires pyarrow. Overridden per call by the `backend` keyword of df_to_db() and db_to_df()."""
 
-            self.limit_log["user_tweets"] = self.return_server_limits()
+        self.ledger = Usage_Ledger(
+            enrollment=self.twitter_enrollment_period, cap=self.monthly_tweet_cap
+        )
+        """Tweets consumed per billing period and endpoint, with a cap forecast."""
 
-            self.limit_log["user_tweets"]["checked_at"] = datetime.datetime.now()
+        self.watermarks = Query_Watermarks()
+        """Per-term high-water marks for incremental get_string_query() polling."""
 
-            if self.response.json().get("errors"):
+        self.pending_watermarks = {}
+        """{parsed query term: (query, newest id)} from incremental polls, set in the watermarks once df_to_db() has stored the capture."""
 
-                return pandas.DataFrame(self.response.json()["errors"])
+        self.pool = None
+        """The Token_Pool, if several tokens were loaded with get_token_pool(). Default `None`."""
 
-            else:
+        self.lookup_errors = pandas.DataFrame()
+        """Usernames the last get_user_profiles() call could not resolve."""
 
-                return pandas.DataFrame([self.response.json()])
+        self.snapshot_errors = {}
+        """{username: exception} for the accounts the last get_user_snapshots() call could not snapshot."""
 
-    def get_user_following(self, user_id: str, **kwargs):
+    def get_token_local(self, path: str) -> None:
 
         """
-        Get all the users the requested account follows. If `pages` is not specified the function will run recursively.
+        Retreive a Twitter bearer token from a JSON with the following schema:
 
-        Endpoint: Users > Follows lookup > Limit: 15
+            {'keys':
 
-        #### Parameters
+                'Bearer Token': 'token'
 
-            user_id : str - The Twitter user's id. This is typically a 64-bit unsigned integer. Passed back to the server as a string to avoid accuracy loss. Read more: https://developer.twitter.com/en/docs/twitter-ids
+                }
 
-            pages : int - Number of pages to request. Pages are 100 tweets. To get a user's entire profile, check their tweet count, divide by 100, and round up. If pages is not specified, the function will run recursively until all available pages have been retrieved or the rate limit has been reached.
+        #### Parameters
 
-            timer : bool - Default `False`. If `True`, the script will use a sleep timer to prevent running over the rate limit. This means one page is collected per minute, until the end of pagination.
+            path : str - File path to the JSON. Must be accessible with open(), and readable by read().
 
-        #### Returns
+        #### Attributes
 
-            pandas.DataFrame - The DataFrame with a user's tweets.
+            self.token : str - The bearer token string.
         """
 
-        df = pandas.DataFrame()
-
-        if "pages" in kwargs.keys():
-
-            pages = kwargs["pages"]
-
-        else:
+        with open(file=path, mode="r") as file:
 
-            pages = 15
+            temp = json.loads(file.read())
 
-        for i in range(pages):
+            self.token = temp["keys"]["Bearer Token"]
+            """This session's bearer token. Acquired from a Twitter developer account. Refer: https://developer.twitter.com/en/docs/twitter-api/getting-started/getting-access-to-the-twitter-api"""
 
-            if i == 0:
+    def get_token_pool(self, *paths: str) -> None:
 
-                self.get_url(
-                    f"https://api.twitter.com/2/users/{user_id}/following?user.fields=id,name,username,public_metrics&max_results=1000"
-                )
+        """
+        Load several bearer tokens into a Token_Pool. Every request then goes out on the token with the most remaining budget for its endpoint.
 
-                df = pandas.DataFrame(self.response.json()["data"])
+        Each JSON may hold one credential, as read by get_token_local(), or a list of them:
 
-            else:
+            {'keys': [
 
-                try:
+                {'Bearer Token': 'token'},
 
-                    next_token = self.response.json()["meta"]["next_token"]
+                {'Bearer Token': 'token'}
 
-                    self.get_url(
-                        f"https://api.twitter.com/2/users/{user_id}/following?user.fields=id,name,username,public_metrics&max_results=1000&pagination_token={next_token}"
-                    )
+                ]}
 
-                    df2 = pandas.DataFrame(self.response.json()["data"])
+        #### Parameters
 
-                    df = pandas.concat([df, df2], axis=0)
+            paths : str - File paths to the JSONs.
 
-                except KeyError:
+        #### Attributes
 
-                    break
+            self.pool : Token_Pool - The loaded tokens.
 
-            if "timer" in kwargs.keys():
+            self.token : str - The token of the last request. Set to the first token until a request is made.
+        """
 
-                timer = kwargs["timer"]
+        tokens = []
 
-            else:
+        for path in paths:
 
-                timer = False
+            with open(file=path, mode="r") as file:
 
-            if timer is True:
+                keys = json.loads(file.read())["keys"]
 
-                print("sleeping...-_-...")
+            if isinstance(keys, dict):
 
-                time.sleep(59)
+                keys = [keys]
 
-        self.limit_log["user_following"] = self.return_server_limits()
+            tokens.extend(i["Bearer Token"] for i in keys)
 
-        self.limit_log["user_following"]["checked_at"] = datetime.datetime.now()
+        self.pool = Token_Pool(tokens)
 
-        return df
+        self.token = tokens[0]
 
-    def get_user_followers(self, user_id: str, **kwargs):
+    def get_url(self, url: str) -> None:
 
         """
-        Get a user's followers.
+        Simple HTTP GET request.
 
-        Attributes
+        #### Parameters
 
-            pages : int
+            url : str - The complete URL, with or without a scheme. If no scheme is specified, defaults to 'https://'.
+
+        #### Attributes
 
-            timer : bool
+            self.response : Twitter_Response - The complete requests.response object, wrapped so the body is decoded once. Served from the response cache if one is enabled and holds a fresh copy.
         """
 
-        df = pandas.DataFrame()
+        if self.cache is not None:
 
-        if "pages" in kwargs.keys():
+            cached = self.cache.get(url, self.token)
 
-            pages = kwargs["pages"]
+            if cached is not None:
 
-        else:
+                self.response = cached
 
-            pages = 15
+                return
 
-        for i in range(pages):
+        response = self.transport.request(
+            self.session,
+            "GET",
+            url,
+            history=self.history,
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
 
-            if i == 0:
+        self.response = Twitter_Response(response)
 
-                self.get_url(
-                    f"https://api.twitter.com/2/users/{user_id}/followers?user.fields=id,name,username,public_metrics&max_results=1000"
-                )
+        if self.cache is not None:
 
-                df = pandas.DataFrame(self.response.json()["data"])
+            self.cache.put(url, self.token, response)
 
-            else:
+    def enable_cache(self, path: str = "data/http_cache.db", **kwargs) -> None:
 
-                try:
+        """
+        Opt in to the on-disk response cache for get_url().
+
+        #### Parameters
 
-                    next_token = self.response.json()["meta"]["next_token"]
+            path : str - The cache database. Default 'data/http_cache.db'.
 
-                    self.get_url(
-                        f"https://api.twitter.com/2/users/{user_id}/followers?user.fields=id,name,username,public_metrics&max_results=1000&pagination_token={next_token}"
-                    )
+            optional kwargs : dict - ttl, max_bytes, offline. See Response_Cache.
+        """
 
-                    df2 = pandas.DataFrame(self.response.json()["data"])
+        self.cache = Response_Cache(path, **kwargs)
 
-                    df = pandas.concat([df, df2], axis=0)
+    def enable_write_behind(self, **kwargs) -> None:
 
-                except KeyError:
+        """
+        Opt in to write-behind storage: df_to_db() types each frame and queues it, and a writer thread commits the queued frames in batches. Call flush() to wait for queued writes and close() when done; pending writes are also committed at interpreter exit.
 
-                    break
+        #### Parameters
 
-            if kwargs.get("timer", False):
+            optional kwargs : dict - batch_rows, linger, max_pending. See Batch_Writer.
+        """
 
-                if kwargs["timer"] is True:
+        self.writer = Batch_Writer(**kwargs)
 
-                    print("sleeping...-_-...")
+        atexit.register(self.writer.close)
 
-                    time.sleep(59)
+    def flush(self) -> None:
 
-        self.limit_log["user_followers"] = self.return_server_limits()
+        """
+        Wait until every write queued by df_to_db() is committed. Raises the first error the writer thread hit.
+        """
 
-        self.limit_log["user_followers"]["checked_at"] = datetime.datetime.now()
+        if self.writer is not None:
 
-        return df
+            self.writer.flush()
 
-    def get_user_snapshot(self, username: str, **kwargs):
+    def close(self) -> None:
 
         """
-        Get profile, tweets, following, and followers of user
-        with no page limits, and write to db.
+        Commit queued writes and stop the writer thread. Later df_to_db() calls write synchronously.
+        """
 
-        Must already have instantiated a Twitter_Session class
-        object, and passed it a bearer token using get_token_local().
+        if self.writer is not None:
 
-        Parameters
+            writer, self.writer = self.writer, None
 
-            username : str - The @username. Can be passed with or without '@'.
+            writer.close()
 
-            followers : bool - Gather followers. Default == `False`.
+    def post_url(self, url: str, **kw):
 
-            following : bool - Gather following. Default == `False`.
         """
+        Simple HTTP POST request.
+        
+        #### Parameters
 
-        df = self.get_user_profile(username)
-        self.df_to_db(df["id"][0], df, "profile")
+            url : str - The complete URL, with or without a scheme. If no scheme is specified, defaults to 'https://'.
 
-        df2 = self.get_user_tweets(df["id"][0])
-        self.df_to_db(df["id"][0], df2, "tweets")
+            optional kwargs : dict - headers, params, json, data
 
-        if kwargs.get("followers", False):
+        #### Attributes
 
-            df3 = self.get_user_following(df["id"][0])
-            self.df_to_db(df["id"][0], df3, "following")
+            self.response : Twitter_Response - The complete requests.response object, wrapped so the body is decoded once.
+        """
 
-        elif kwargs.get("following", False):
+        response = self.transport.request(
+            self.session,
+            "POST",
+            url,
+            history=self.history,
+            retry=False,
+            headers=kw.get('oauth', False),
+            params=kw.get('params', False),
+            json=kw.get('json', False),
+            data=kw.get('data', False),
+        )
 
-            df4 = self.get_user_followers(df["id"][0])
-            self.df_to_db(df["id"][0], df4, "followers")
+        self.response = Twitter_Response(response)
 
-    def get_string_query(self, query: str, **kwargs):
+    def _get_page(self, endpoint: str, url: str, **kwargs) -> None:
 
         """
-        Query Twitter. Returns the last n pages of tweets containing the query string.
+        GET one page of an endpoint and log its rate limits.
+
+        With `timer=True` the scheduler is consulted before the call, and a 429 is waited out until the limit resets, then retried. A 429 the scheduler cannot wait out, one without rate-limit headers or with a reset already past, is retried with the transport's exponential backoff instead. With a token pool, the token with the most remaining budget for the endpoint is used, along with its scheduler.
 
         #### Parameters
 
-            query : str - The string to be searched for. Can include hashtags.
+            endpoint : str - The limit log key, e.g. 'user_tweets'.
 
-            pages : int - The number of pages to return. A page is 100 tweets. Default = 0.
-        """
+            url : str - The complete URL.
 
-        if "pages" in kwargs.keys():
+            timer : bool - Default `False`.
 
-            pages = kwargs["pages"]
+        #### Raises
 
-        else:
+            requests.exceptions.HTTPError - If the endpoint still answers 429 after the transport's retries.
+        """
 
-            pages = 1
+        timer = kwargs.get("timer", False)
 
-        df = pandas.DataFrame()
+        attempt = 0
 
-        for i in range(pages):
+        while True:
 
-            if i == 0:
+            if self.pool is not None:
 
-                self.get_url(
-                    f"https://api.twitter.com/2/tweets/search/recent?query={urllib.parse.quote(query)}&max_results=100"
-                )
+                self.token = self.pool.acquire(endpoint)
 
-                self.limit_log["query"] = self.return_server_limits()
+                self.scheduler = self.pool.schedulers[self.token]
 
-                self.limit_log["query"]["checked_at"] = datetime.datetime.now()
+            if timer is True and not (
+                self.cache is not None and self.cache.contains(url, self.token)
+            ):
 
-                df = pandas.DataFrame(self.response.json()["data"])
+                self.scheduler.wait(endpoint)
 
-            else:
+            self.get_url(url)
 
-                next_token = self.response.json()["meta"]["next_token"]
+            self._log_limits(endpoint)
 
-                self.get_url(
-                    f"https://api.twitter.com/2/tweets/search/recent?query={urllib.parse.quote(query)}&max_results=100&pagination_token={next_token}"
-                )
+            if timer is not True or self.response.status_code != 429:
 
-                self.limit_log["query"] = self.return_server_limits()
+                break
 
-                self.limit_log["query"]["checked_at"] = datetime.datetime.now()
+            if attempt == self.transport.retries:
 
-                df2 = pandas.DataFrame(self.response.json()["data"])
+                raise requests.exceptions.HTTPError(
+                    f"429 Too Many Requests from {endpoint} after {attempt + 1} attempts",
+                    response=self.response,
+                )
 
-                df = pandas.concat([df, df2], axis=0)
+            if not self.scheduler.blocked(endpoint):
 
-        self.query_log[len(self.query_log)] = {
-            "timestamp": datetime.datetime.now(),
-            "x-transaction-id": self.response.headers["x-transaction-id"],
-            "query_term": query,
-            "parsed_query_term": urllib.parse.quote(query),
-        }
+                time.sleep(self.transport.delay(attempt, self.response))
 
-        return df.reset_index()
+            attempt += 1
 
-    def return_server_limits(self) -> tuple[float, float, str, int, str]:
+    def _log_limits(self, endpoint: str) -> None:
 
         """
-        Return Twitter server rate limits and timers from the response in memory. Used to update the limit log internally.
+        Update the limit log and the scheduler from the response in memory. Responses without rate-limit headers, and responses served from the cache, are skipped.
+        """
 
-        #### Returns
+        if self.response.cached:
 
-            A dictionary with the following schema:
+            return
 
-                {
-                    'remaining': float,
-                    'limit': float,
-                    'limit_reset': str,
-                    'percent_remaining': int,
-                    'limit_delta': str
-                    }
+        try:
 
-            ##### Attributes
+            limits = self.return_server_limits()
 
-                remaining : float - Transmission-rate limit remaining in epoch for this endpoint.
+        except KeyError:
 
-                limit : float - Total call limit for the endpoint, per epoch.
+            return
 
-                limit_reset : str - The time when the limit epoch resets. Converted from unix time stamp to a string with `%H:%M:%S` format.
+        limits["checked_at"] = datetime.datetime.now()
 
-                percent_remaining : int - Percentage remaining in the call limit, for this epoch.
+        self.limit_log[endpoint] = limits
 
-                limit_delta : str - Difference between when the limit resets and now, in `%H:%M:%S` format.
-        """
+        self.scheduler.update(endpoint, limits)
 
-        return_headers = self.response.headers
+    def get_user_profile(self, username: str, **kwargs) -> pandas.DataFrame:
 
-        remaining = float(return_headers["x-rate-limit-remaining"])
+        """
+        Request Twitter's users by username endpoint. Resets index.
 
-        limit = float(return_headers["x-rate-limit-limit"])
+        #### Parameters
 
-        percent_remaining = int(float(remaining) / float(limit) * 100)
+            username : str - The @username. Can be passed with or without '@'.
 
-        # TODO rename this variable
-        # NOTE this is used as the delta in a streamlit.metric object
-        remaining_math = (100 - percent_remaining) * -1
+            timer : bool - Default `False`. If `True`, wait on the session scheduler instead of running into a 429.
 
-        # TODO there has to be a better way than the following:
-        limit_reset = time.strftime(
-            "%H:%M:%S", time.localtime(int(return_headers["x-rate-limit-reset"]))
-        )
+        #### Returns
 
-        limit_reset = datetime.datetime.strptime(limit_reset, "%H:%M:%S")
+            pandas.DataFrame - A parsed DataFrame generated from the response JSON.
+        """
 
-        limit_reset = limit_reset.time()
+        if username[0] == "@":
 
-        time_now = datetime.datetime.now()
+            username = username[1:]
 
-        time_now = datetime.datetime.strptime(
-            f"{time_now.hour}:{time_now.minute}:{time_now.second}", "%H:%M:%S"
+        self._get_page(
+            "user_profile",
+            f"https://api.twitter.com/2/users/by/username/{username}?user.fields=description,public_metrics,profile_image_url",
+            **kwargs,
         )
 
-        time_now = time_now.time()
+        try:
 
-        limit_reset = datetime.datetime.combine(datetime.date.today(), limit_reset)
+            df = pandas.DataFrame(data=self.response.json()["data"])
 
-        time_now = datetime.datetime.combine(datetime.date.today(), time_now)
+            df = df.reset_index()
 
-        limit_delta = str(limit_reset - time_now)
+            df = df.rename(columns={"index": "metric"})
 
-        limit_reset = datetime.datetime.strftime(limit_reset, "%H:%M:%S")
+            return df
 
-        dict = {
-            "remaining": remaining,
-            "limit": limit,
-            "limit_reset": limit_reset,
-            "percent_remaining": percent_remaining,
-            "limit_delta": limit_delta,
-        }
+        except KeyError:
 
-        return dict
+            return pandas.DataFrame(self.response.json()["errors"])
 
-    def df_to_db(self, id: str, data: pandas.DataFrame, type: str, **kwargs):
+    def get_user_profiles(self, usernames: list, **kwargs) -> pandas.DataFrame:
 
         """
-        Write user's twitter data to a SQLite3 database using an SQLAlchemy engine.
+        Request Twitter's multi-user lookup endpoint, 100 usernames per call. One row per user, with public_metrics flattened into columns.
+
+        Usernames the server could not resolve are reported in self.lookup_errors rather than failing the batch.
 
         #### Parameters
 
-            data : pandas.DataFrame - The DataFrame with user profile data, as formatted by get_user_profile().
+            usernames : list[str] - The @usernames. Can be passed with or without '@'. Duplicates are requested once; blank entries are skipped.
 
-            type : str - profile, tweets, following, query
+            timer : bool - Default `False`. If `True`, wait on the session scheduler instead of running into a 429.
+
+        #### Returns
 
-            query_term : str - The term used in a get_string_query().
+            pandas.DataFrame - The profiles of every resolved user.
 
         #### Attributes
 
-            id : str - The table id to be stored under. If type is profile, tweets, or following the id will be the user id of the profile. If a query, use 'x-transaction-id' from the query response header.
+            self.lookup_errors : pandas.DataFrame - One row per unresolved username, with the server's value, title, and detail.
+        """
 
-        #### Example
+        usernames = [i.strip().removeprefix("@") for i in usernames]
 
-            `t1 = Twitter_Session()`
-            `t1.get_token_local('/home/user/keys.json')`
-            `df = t1.get_user_profile('elonmusk')`
-            `t1.df_to_db(user_id = df['id'][0], data = df, type='profile')`
-            `df2 = t1.get_user_tweets(user_id = df['id'][0])`
-            `t1.df_to_db(user_id = df['id'][0], data = df2, type='tweets')`
-        """
+        usernames = list(dict.fromkeys(i for i in usernames if i))
 
-        try:
+        records = []
 
-            query_term = kwargs["query_term"]
+        errors = []
 
-        except KeyError:
+        for i in range(0, len(usernames), 100):
 
-            query_term = ""
+            chunk = ",".join(usernames[i : i + 100])
 
-        if type == "profile":
+            self._get_page(
+                "user_profiles",
+                f"https://api.twitter.com/2/users/by?usernames={chunk}&user.fields=description,public_metrics,profile_image_url",
+                **kwargs,
+            )
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+            payload = self.response.json()
 
-            table_name = "profile"
+            records.extend(payload.get("data", []))
 
-        elif type == "tweets":
+            errors.extend(payload.get("errors", []))
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+            if "data" not in payload and "errors" not in payload:
 
-            table_name = "tweets"
+                errors.extend({"value": j, **payload} for j in usernames[i : i + 100])
 
-        elif type == "following":
+        self.lookup_errors = pandas.DataFrame(errors)
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+        return _flatten_metrics(pandas.DataFrame(records))
 
-            table_name = "following"
+    def _iter_pages(self, endpoint: str, url: str, **kwargs):
 
-        elif type == "followers":
+        """
+        Generator over the pages of a paginated endpoint. Yields the raw `data` records of each page, following `meta.next_token` until it runs out or `pages` have been requested.
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+        If a crawl key is given along with `checkpoint` or `resume`, the cursor and every completed page are checkpointed to the session's Crawl_Checkpoints as the crawl runs. Otherwise the checkpoint store is not touched. The checkpoint is cleared when the crawl ends cleanly, and kept if it is interrupted by an exception or an error response.
 
-            table_name = "followers"
+        #### Parameters
 
-        elif type == "query":
+            endpoint : str - The limit log key, e.g. 'user_tweets'.
 
-            engine = sqlalchemy.create_engine("sqlite:///data/twitter_queries.db")
+            url : str - The complete URL of the first page.
 
-            table_name = id
-            """For queries, use self.response.headers['x-transaction-id']"""
+            pages : int - Number of pages to request, including any resumed pages.
 
-            data.insert(0, "query_term", [query_term for i in range(len(data))])
+            required : bool - Default `True`. Raise KeyError if the first page has no data. If `False`, an empty first page ends the generator and the response stays in memory for the caller.
 
-        else:
+            crawl : str - Checkpoint key, e.g. 'user_tweets/44196397'. Default `None`, no checkpoints.
 
-            raise ValueError("type must be one of: profile, tweets, following, query")
+            checkpoint : bool - Default `False`, or `True` when resuming. If `True`, checkpoint the crawl under its key.
 
-        try:
+            resume : bool - Default `False`. If `True`, yield the checkpointed pages, then continue from the saved next_token. Otherwise any old checkpoint for the crawl is discarded.
 
-            data.insert(
-                0,
-                "capture_timestamp",
-                [datetime.datetime.now() for i in range(len(data))],
-            )
+            timer : bool - Passed to _get_page().
 
-        except ValueError:  # work-around to avoid producing a Nonetype DataFrame
+        #### Raises
 
-            data.drop(labels="capture_timestamp", axis=1, inplace=True)
+            UsageCapExceeded - If any page, the first included, reports the monthly cap reached.
+        """
 
-            data.insert(
-                0,
-                "capture_timestamp",
-                [datetime.datetime.now() for i in range(len(data))],
-            )
+        crawl = kwargs.get("crawl") if _checkpointed(kwargs) else None
 
-        data = data.astype("str")
+        start = 0
 
-        data = data.sort_index()
+        next_token = None
 
-        data.to_sql(name=str(table_name), con=engine, if_exists="append", index=False)
+        complete = True
 
-        engine.dispose()
+        if crawl is not None:
 
-    def db_to_df(self, id: str, type: str) -> pandas.DataFrame:
+            saved = None
 
-        """
-        Read a user's data from a specified database into a pandas DataFrame.
+            if kwargs.get("resume", False):
 
-        #### Paramters
+                saved = self.checkpoints.load(crawl)
 
-            id : str - The user id of the profile. Can be referenced from the dataframe, or passed as string.
+            if saved is None:
 
-            type : str - profile, tweets, following
-        """
+                self.checkpoints.clear(crawl)
 
-        if type == "profile":
+            else:
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+                next_token, stored = saved
 
-            table_name = "profile"
+                for records in stored:
 
-        elif type == "tweets":
+                    yield records
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+                start = len(stored)
 
-            table_name = "tweets"
+        for i in range(start, kwargs["pages"]):
 
-        elif type == "following":
+            if i == 0:
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+                self._get_page(endpoint, url, **kwargs)
 
-            table_name = "following"
+            else:
 
-        elif type == "followers":
+                if i > start:
 
-            engine = sqlalchemy.create_engine(f"sqlite:///data/{id}.db")
+                    next_token = payload.get("meta", {}).get("next_token")
 
-            table_name = "followers"
+                if next_token is None:
 
-        elif type == "query":
+                    break
 
-            engine = sqlalchemy.create_engine("sqlite:///data/twitter_queries.db")
+                self._get_page(
+                    endpoint, f"{url}&pagination_token={next_token}", **kwargs
+                )
 
-            table_name = id
-            """For queries, use self.response.headers['x-transaction-id']"""
+            payload = self.response.json()
 
-        else:
+            if "data" not in payload:
 
-            raise ValueError("type must be one of: profile, tweets, following, query")
+                if payload.get("title") == "UsageCapExceeded":
 
-        df = pandas.read_sql_table(table_name=table_name, con=engine)
+                    raise UsageCapExceeded(f"Usage cap exceeded for {endpoint}.")
 
-        engine.dispose()
+                if i == 0 and kwargs.get("required", True):
 
-        return df
+                    raise KeyError("data")
 
-    def get_dbs(self):
+                complete = "title" not in payload
+
+                break
+
+            if crawl is not None:
+
+                self.checkpoints.save(
+                    crawl, i, payload["data"], payload.get("meta", {}).get("next_token")
+                )
+
+            if not self.response.cached:
+
+                self.ledger.record(endpoint, len(payload["data"]))
+
+            yield payload["data"]
+
+        if crawl is not None and complete:
+
+            self.checkpoints.clear(crawl)
+
+    def iter_user_tweets(self, user_id: str, **kwargs):
 
         """
-        Retrieve Twitter databases. Uses regex to check file names for an expected convention.
+        Stream a user's tweets one page at a time. See get_user_tweets() for parameters.
 
-        This will be deprecated by class Database_Functions.
+        #### Parameters
 
-        Returns
+            frames : bool - Default `False`. If `True`, yield a DataFrame per page with public_metrics flattened into columns, instead of the raw records.
 
-            A list of database files by user id.
+        #### Yields
+
+            list[dict] | pandas.DataFrame - One page of up to 100 tweets.
         """
 
-        files = glob.glob("data/*.db")
+        kwargs.setdefault("pages", 1500)
 
-        l = [
-            re.search(r"(\d+.db)", i) for i in files
-        ]  # regex for any files consisting of [0-9].db
+        since_id = kwargs.get("since_id")
 
-        processed_list = [x for x in l if x is not None]
+        url = f"https://api.twitter.com/2/users/{user_id}/tweets?tweet.fields=created_at,text,public_metrics&max_results=100"
 
-        return processed_list
+        if since_id is not None:
 
-    def tweet_log(self):
+            url = f"{url}&since_id={since_id}"
 
-        """
-        Tweet a log event of a specified schema.
+        for records in self._iter_pages(
+            "user_tweets",
+            url,
+            crawl=f"user_tweets/{user_id}",
+            required=False,
+            **kwargs,
+        ):
 
-        Endpoint URL: https://api.twitter.com/2/tweets
-        Twitter Doc: https://developer.twitter.com/en/docs/twitter-api/tweets/manage-tweets/api-reference/post-tweets
+            records, known = _newer_than(records, since_id)
 
-        Parameters:
+            if records:
 
-            schema : str - One of 'reading', 'programming', 'watching', 'researching', 'listening'.
+                if kwargs.get("frames", False):
 
-            hastags : list[str] - Hashtags to include in the Tweet.
+                    yield _flatten_metrics(pandas.DataFrame(records))
 
-            mentions : list[str] - Usernames to mention in the Tweet. May include '@' or not.
+                else:
 
-            emojis : list[str] - Emojis to include in the post. Can be markup shortcode or keyword.
-        """
+                    yield records
 
-        # TODO test session.post function schema
+            if known:
 
-        self.post_url(
-            url=f'',
-        )
+                if _checkpointed(kwargs):
 
+                    self.checkpoints.clear(f"user_tweets/{user_id}")
 
-@dataclass
-class Database_Functions:
-    def __init__(self):
+                break
 
-        """Database functions."""
+    def get_user_tweets(self, user_id: str, **kwargs):
 
-    def list_db_keys(self):
+        """
+        Get all a user's tweets. This is a costly operation in that Twitter paginates tweets
 
-        files = glob.glob("data/*.db")
+        100 at a time. Due to rate limits, and depending on how many tweets a user has, this
 
-        list_keys = []
+        may take a while. Twitter rate epochs reset 15 minutes after the first call has been
 
-        for i in files:
+        made. The rate limits vary. Refer to the rate limits returned in the headers of this
 
-            engine = sqlalchemy.create_engine(
-                f"sqlite+pysqlite:///{i}", echo=False, future=True
-            )
+        class.
 
-            s = sqlalchemy.schema.MetaData(bind=engine)
+        #### Parameters
 
-            s.reflect()
+            user_id : str - The Twitter user's id. This is typically a 64-bit unsigned integer. Passed back to the server as a string to avoid accuracy loss. Read more: https://developer.twitter.com/en/docs/twitter-ids
 
-            list_keys.append((s.tables.keys(), i))
+            pages : int - Number of pages to request. Pages are 100 tweets. To get a user's entire profile, check their tweet count, divide by 100, and round up. If pages is not specified, the function will run recursively until all available pages have been retrieved or the rate limit has been reached.
 
-        return list_keys
+            timer : bool - Default `False`. If `True`, wait on the session scheduler instead of running into a 429.
 
-    def list_db_tables(self, db):
+            resume : bool - Default `False`. If `True`, continue an interrupted crawl from its checkpoint in data/checkpoints.db instead of starting over, and checkpoint the crawl as it runs.
 
-        engine = sqlalchemy.create_engine(
-            f"sqlite+pysqlite:///{db}", echo=True, future=True
-        )
+            checkpoint : bool - Default `False`. If `True`, checkpoint the crawl to data/checkpoints.db so an interrupted run can be resumed. Implied by `resume`.
 
-        s = sqlalchemy.schema.MetaData(bind=engine)
+            since_id : str - Only fetch tweets newer than this id. Pagination stops at the first page that reaches a known id. See newest_tweet_id().
 
-        s.reflect()
+        #### Returns
 
-        return s.tables
+            pandas.DataFrame - The DataFrame with a user's tweets. Empty if there is nothing newer than since_id.
 
+        #### Example
 
-class Streamlit_Functions:
-    def __init__(self):
-        """
-        A class for Streamlit utilities.
-        """
+            Getting all available user tweets
 
-    def set_boilerplate(self, **kwargs):
+            `df = t1.get_user_profile('elonmusk')`
+            `df = t1.get_user_tweets(df['id'][0], round(df['tweet_count'][0] / 100))`
         """
-        Boilerplate setup for a Streamlit page.
 
-        Parameters
+        frames = list(self.iter_user_tweets(user_id, frames=True, **kwargs))
 
-            page_title : str - The title bar page name.
+        if frames:
 
-            scroll_text : str - The text to scroll when the page loads.
+            return pandas.concat(frames, axis=0, ignore_index=True)
 
-            metrics : bool - Show the metrics during operations, in expanders.
-        """
+        if self.response.json().get("errors"):
 
-        if "page_title" in kwargs.keys():
+            return pandas.DataFrame(self.response.json()["errors"])
 
-            page_title = str(kwargs["page_title"])
+        elif self.response.json().get("meta", {}).get("result_count") == 0:
+
+            return pandas.DataFrame()
 
         else:
 
-            page_title = "solarcho3/Web Tools"
+            return pandas.DataFrame([self.response.json()])
 
-        scroll_text = ""
+    def newest_tweet_id(self, user_id: str):
 
-        if kwargs.get("scroll_text"):
+        """
+        The newest tweet id stored in a user's `tweets` table, or their shard, for use as since_id.
 
-            scroll_text = str(kwargs["scroll_text"])
+        #### Parameters
 
-        import streamlit as st
+            user_id : str - The user id of the profile.
 
-        st.set_page_config(page_title=page_title, page_icon=":wrench:", layout="wide")
+        #### Returns
 
-        if kwargs.get("metrics", False):
+            str - The id, or None if the user has no stored tweets.
+        """
 
-            with st.expander("🌡️ Twitter API-server rate limit metrics"):
+        newest = []
 
-                self.metrics_col1, self.metrics_col2, self.metrics_col3 = st.columns(3)
+        for engine, shard in _user_sources(user_id, "tweets"):
 
-            with st.expander("📻 Traffic log"):
+            with engine.connect() as conn:
 
-                traffic = st.columns(1)
+                row = conn.execute(
+                    sqlalchemy.text(
+                        "SELECT id FROM tweets WHERE id GLOB '[0-9]*' "
+                        + ("AND user_id = :user " if shard else "")
+                        + "ORDER BY CAST(id AS INTEGER) DESC LIMIT 1"
+                    ),
+                    {"user": str(user_id)},
+                ).fetchone()
 
-        scroll_container = st.empty()
+            if row is not None:
 
-        store = ""
+                newest.append(int(row[0]))
 
-        for char in scroll_text:
+        return str(max(newest)) if newest else None
 
-            store = store + char
+    def sync_user_tweets(self, user_id: str, **kwargs) -> pandas.DataFrame:
 
-            scroll_container.text(store)
+        """
+        Incremental timeline sync: fetch only the tweets newer than the newest one stored in data/{user_id}.db, and append them with df_to_db.
 
-            time.sleep(0.005)
+        #### Parameters
 
-    def update_metrics(self, data):
+            user_id : str - The Twitter user's id.
+
+            optional kwargs : dict - pages, timer, resume. See get_user_tweets().
+
+        #### Returns
+
+            pandas.DataFrame - The new tweets written. Empty if there were none.
         """
-        Update the boilerplate metrics.
+
+        df = self.get_user_tweets(
+            user_id, since_id=self.newest_tweet_id(user_id), **kwargs
+        )
+
+        if "id" in df.columns and len(df):
+
+            self.df_to_db(user_id, df, "tweets")
+
+        return df
+
+    def iter_user_following(self, user_id: str, **kwargs):
+
         """
+        Stream the users an account follows one page at a time. See get_user_following() for parameters.
 
-        keys_list = list(data.keys())
+        #### Parameters
 
-        self.metrics_col1.metric(
-            f"{keys_list[0]} % remaining",
-            data[keys_list[0]]["percent_remaining"],
-            round((1000 / data[keys_list[0]]["remaining"]) * -1, 2),
-        )
+            frames : bool - Default `False`. If `True`, yield a DataFrame per page instead of the raw records.
 
-        self.metrics_col2.metric(
-            keys_list[0], data[keys_list[0]]["limit"], data[keys_list[0]]["remaining"]
-        )
+        #### Yields
+
+            list[dict] | pandas.DataFrame - One page of up to 1000 users.
+        """
+
+        kwargs.setdefault("pages", 15)
+
+        for records in self._iter_pages(
+            "user_following",
+            f"https://api.twitter.com/2/users/{user_id}/following?user.fields=id,name,username,public_metrics&max_results=1000",
+            crawl=f"user_following/{user_id}",
+            **kwargs,
+        ):
+
+            yield pandas.DataFrame(records) if kwargs.get("frames", False) else records
+
+    def get_user_following(self, user_id: str, **kwargs):
+
+        """
+        Get all the users the requested account follows. If `pages` is not specified the function will run recursively.
+
+        Endpoint: Users > Follows lookup > Limit: 15
+
+        #### Parameters
+
+            user_id : str - The Twitter user's id. This is typically a 64-bit unsigned integer. Passed back to the server as a string to avoid accuracy loss. Read more: https://developer.twitter.com/en/docs/twitter-ids
+
+            pages : int - Number of pages to request. Pages are 100 tweets. To get a user's entire profile, check their tweet count, divide by 100, and round up. If pages is not specified, the function will run recursively until all available pages have been retrieved or the rate limit has been reached.
+
+            timer : bool - Default `False`. If `True`, the session scheduler spends the endpoint's remaining budget at full speed, then blocks until the limit resets.
+
+            resume : bool - Default `False`. If `True`, continue an interrupted crawl from its checkpoint in data/checkpoints.db instead of starting over, and checkpoint the crawl as it runs.
+
+            checkpoint : bool - Default `False`. If `True`, checkpoint the crawl to data/checkpoints.db so an interrupted run can be resumed. Implied by `resume`.
+
+        #### Returns
+
+            pandas.DataFrame - The DataFrame with a user's tweets.
+        """
+
+        records = [
+            record
+            for page in self.iter_user_following(user_id, **kwargs)
+            for record in page
+        ]
+
+        return pandas.DataFrame(records)
+
+    def iter_user_followers(self, user_id: str, **kwargs):
+
+        """
+        Stream a user's followers one page at a time. See get_user_followers() for parameters.
+
+        #### Parameters
+
+            frames : bool - Default `False`. If `True`, yield a DataFrame per page instead of the raw records.
+
+        #### Yields
+
+            list[dict] | pandas.DataFrame - One page of up to 1000 users.
+        """
+
+        kwargs.setdefault("pages", 15)
+
+        for records in self._iter_pages(
+            "user_followers",
+            f"https://api.twitter.com/2/users/{user_id}/followers?user.fields=id,name,username,public_metrics&max_results=1000",
+            crawl=f"user_followers/{user_id}",
+            **kwargs,
+        ):
+
+            yield pandas.DataFrame(records) if kwargs.get("frames", False) else records
+
+    def get_user_followers(self, user_id: str, **kwargs):
+
+        """
+        Get a user's followers.
+
+        Attributes
+
+            pages : int
+
+            timer : bool - Default `False`. If `True`, wait on the session scheduler instead of running into a 429.
+
+            resume : bool - Default `False`. If `True`, continue an interrupted crawl from its checkpoint in data/checkpoints.db instead of starting over, and checkpoint the crawl as it runs.
+
+            checkpoint : bool - Default `False`. If `True`, checkpoint the crawl to data/checkpoints.db so an interrupted run can be resumed. Implied by `resume`.
+        """
+
+        records = [
+            record
+            for page in self.iter_user_followers(user_id, **kwargs)
+            for record in page
+        ]
+
+        return pandas.DataFrame(records)
+
+    def get_user_snapshot(self, username: str, **kwargs):
+
+        """
+        Get profile, tweets, following, and followers of user
+        with no page limits, and write to db.
+
+        Must already have instantiated a Twitter_Session class
+        object, and passed it a bearer token using get_token_local().
+
+        The endpoints after the profile lookup are paginated concurrently by a Snapshot_Engine. This is the synchronous wrapper around Snapshot_Engine.snapshot().
+
+        Parameters
+
+            username : str - The @username. Can be passed with or without '@'.
+
+            followers : bool - Gather followers. Default == `False`.
+
+            following : bool - Gather following. Default == `False`.
+
+            timer : bool - Passed through to each paginated getter.
+
+            resume : bool - Passed through to each paginated getter.
+
+            incremental : bool - Only fetch tweets newer than the ones already stored. Default == `False`.
+
+        Returns
+
+            dict - The DataFrames written, keyed by type.
+        """
+
+        return _run_sync(Snapshot_Engine(self).snapshot(username, **kwargs))
+
+    def get_user_snapshots(self, usernames: list, **kwargs) -> dict:
+
+        """
+        Snapshot many users at once. Every endpoint paginates in its own lane, so the wall-clock time is set by the slowest endpoint rather than the sum of all of them.
+
+        An account that fails is reported in self.snapshot_errors rather than failing the batch.
+
+        #### Parameters
+
+            usernames : list[str] - The @usernames. Can be passed with or without '@'.
+
+            optional kwargs : dict - followers, following, timer, resume, incremental. See get_user_snapshot().
+
+        #### Returns
+
+            dict - {username: {type: pandas.DataFrame}} for the accounts snapshotted.
+
+            self.snapshot_errors : dict - {username: exception} for the accounts that failed.
+        """
+
+        return _run_sync(Snapshot_Engine(self).snapshot_many(usernames, **kwargs))
+
+    def _spawn(self):
+
+        """
+        Return a worker session sharing this session's credentials. Each worker owns its own requests.Session and response, so concurrent paginations never read each other's pages.
+        """
+
+        worker = Twitter_Session()
+
+        worker.token = self.token
+
+        worker.pool = self.pool
+
+        worker.transport = self.transport
+
+        worker.session = self.transport.session()
+
+        worker.history = self.history
+
+        worker.scheduler = self.scheduler
+
+        worker.checkpoints = self.checkpoints
+
+        worker.watermarks = self.watermarks
+
+        worker.ledger = self.ledger
+
+        worker.cache = self.cache
+
+        worker.writer = self.writer
+
+        worker.backend = self.backend
+
+        return worker
+
+    def iter_string_query(self, query: str, **kwargs):
+
+        """
+        Stream a query one page at a time. The query is added to the query log once the last page has been read. See get_string_query() for parameters.
+
+        #### Parameters
+
+            frames : bool - Default `False`. If `True`, yield a DataFrame per page instead of the raw records.
+
+        #### Yields
+
+            list[dict] | pandas.DataFrame - One page of up to 100 tweets.
+        """
+
+        kwargs.setdefault("pages", 1)
+
+        url = f"https://api.twitter.com/2/tweets/search/recent?query={urllib.parse.quote(query)}&tweet.fields=created_at,author_id,public_metrics&max_results=100"
+
+        since_id = None
+
+        if kwargs.get("incremental", False):
+
+            since_id = self.watermarks.get(query)
+
+            kwargs["required"] = False
+
+        if since_id is not None:
+
+            url = f"{url}&since_id={since_id}"
+
+        newest = since_id
+
+        known = False
+
+        for records in self._iter_pages("query", url, **kwargs):
+
+            records, known = _newer_than(records, since_id)
+
+            if records:
+
+                top = max(int(i["id"]) for i in records)
+
+                if newest is None or top > int(newest):
+
+                    newest = str(top)
+
+                if kwargs.get("frames", False):
+
+                    yield pandas.DataFrame(records)
+
+                else:
+
+                    yield records
+
+            if known:
+
+                break
+
+        reached = (
+            since_id is None
+            or known
+            or "next_token" not in self.response.json().get("meta", {})
+        )
+
+        if kwargs.get("incremental", False) and newest != since_id and reached:
+
+            self.pending_watermarks[urllib.parse.quote(query)] = (query, newest)
+
+        self.query_log[len(self.query_log)] = {
+            "timestamp": datetime.datetime.now(),
+            "x-transaction-id": self.response.headers["x-transaction-id"],
+            "query_term": query,
+            "parsed_query_term": urllib.parse.quote(query),
+        }
+
+    def get_string_query(self, query: str, **kwargs):
+
+        """
+        Query Twitter. Returns the last n pages of tweets containing the query string, with their created_at, author_id and public metrics.
+
+        #### Parameters
+
+            query : str - The string to be searched for. Can include hashtags.
+
+            pages : int - The number of pages to return. A page is 100 tweets. Default = 0.
+
+            timer : bool - Default `False`. If `True`, wait on the session scheduler instead of running into a 429.
+
+            incremental : bool - Default `False`. If `True`, only request tweets newer than the term's high-water mark, stored in data/twitter_queries.db. Pagination stops once there are no new results. The mark advances when df_to_db() stores the capture, and only if pagination reached the old mark or ran out of pages; a poll cut short by `pages` is repeated from the old mark rather than leaving a gap.
+        """
+
+        frames = list(self.iter_string_query(query, frames=True, **kwargs))
+
+        if not frames:
+
+            return pandas.DataFrame()
+
+        return pandas.concat(frames, axis=0).reset_index()
+
+    def return_server_limits(self) -> tuple[float, float, str, int, str]:
+
+        """
+        Return Twitter server rate limits and timers from the response in memory. Used to update the limit log internally.
+
+        #### Returns
+
+            A dictionary with the following schema:
+
+                {
+                    'remaining': float,
+                    'limit': float,
+                    'limit_reset': str,
+                    'percent_remaining': int,
+                    'limit_delta': str,
+                    'reset_at': int
+                    }
+
+            ##### Attributes
+
+                remaining : float - Transmission-rate limit remaining in epoch for this endpoint.
+
+                limit : float - Total call limit for the endpoint, per epoch.
+
+                limit_reset : str - The time when the limit epoch resets. Converted from unix time stamp to a string with `%H:%M:%S` format.
+
+                percent_remaining : int - Percentage remaining in the call limit, for this epoch.
+
+                limit_delta : str - Difference between when the limit resets and now, in `%H:%M:%S` format.
+
+                reset_at : int - The unix time stamp when the limit epoch resets.
+        """
+
+        return_headers = self.response.headers
+
+        remaining = float(return_headers["x-rate-limit-remaining"])
+
+        limit = float(return_headers["x-rate-limit-limit"])
+
+        percent_remaining = int(float(remaining) / float(limit) * 100)
+
+        # TODO rename this variable
+        # NOTE this is used as the delta in a streamlit.metric object
+        remaining_math = (100 - percent_remaining) * -1
+
+        # TODO there has to be a better way than the following:
+        limit_reset = time.strftime(
+            "%H:%M:%S", time.localtime(int(return_headers["x-rate-limit-reset"]))
+        )
+
+        limit_reset = datetime.datetime.strptime(limit_reset, "%H:%M:%S")
+
+        limit_reset = limit_reset.time()
+
+        time_now = datetime.datetime.now()
+
+        time_now = datetime.datetime.strptime(
+            f"{time_now.hour}:{time_now.minute}:{time_now.second}", "%H:%M:%S"
+        )
+
+        time_now = time_now.time()
+
+        limit_reset = datetime.datetime.combine(datetime.date.today(), limit_reset)
+
+        time_now = datetime.datetime.combine(datetime.date.today(), time_now)
+
+        limit_delta = str(limit_reset - time_now)
+
+        limit_reset = datetime.datetime.strftime(limit_reset, "%H:%M:%S")
+
+        dict = {
+            "remaining": remaining,
+            "limit": limit,
+            "limit_reset": limit_reset,
+            "percent_remaining": percent_remaining,
+            "limit_delta": limit_delta,
+            "reset_at": int(return_headers["x-rate-limit-reset"]),
+        }
+
+        return dict
+
+    def df_to_db(self, id: str, data: pandas.DataFrame, type: str, **kwargs):
+
+        """
+        Write user's twitter data to a SQLite3 database using an SQLAlchemy engine.
+
+        Columns are stored with the declared types in storage_schemas: ids and metric counts as INTEGER, times as DATETIME. Nested public_metrics are flattened into columns, profile metric rows are pivoted into one row per capture, and other nested values are stored as JSON text. Columns the table does not have yet are added.
+
+        Writes are idempotent on the keys in storage_keys: a tweet or user already stored keeps its row and first capture_timestamp, and only its metric counts are refreshed. Profile rows are a time series and are always appended.
+
+        #### Parameters
+
+            data : pandas.DataFrame | Iterable - The DataFrame with user profile data, as formatted by get_user_profile(). May also be a stream of pages from an iter_* method; each page is written as it arrives.
+
+            type : str - profile, tweets, following, query
+
+            query_term : str - The term used in a get_string_query(). An incremental poll's high-water mark for the term is advanced once this write is committed.
+
+            sync : bool - Default `False`. If `True`, write now even when write-behind is enabled.
+
+            backend : str - 'sqlite' or 'parquet'. Default self.backend. Parquet appends a file per write to the hive-partitioned dataset data/parquet/{type}, partitioned by capture_date and query_term for queries, by user_id and capture_date otherwise. It is append-only: rows are not upserted.
+
+        #### Attributes
+
+            id : str - The table id to be stored under. If type is profile, tweets, or following the id will be the user id of the profile. If a query, use 'x-transaction-id' from the query response header; every query capture is appended to the one query_results table of data/twitter_queries.db, with the id in its transaction_id column.
+
+        #### Example
+
+            `t1 = Twitter_Session()`
+            `t1.get_token_local('/home/user/keys.json')`
+            `df = t1.get_user_profile('elonmusk')`
+            `t1.df_to_db(user_id = df['id'][0], data = df, type='profile')`
+            `df2 = t1.get_user_tweets(user_id = df['id'][0])`
+            `t1.df_to_db(user_id = df['id'][0], data = df2, type='tweets')`
+            `t1.df_to_db(df['id'][0], t1.iter_user_followers(df['id'][0]), 'followers')`
+        """
+
+        if not isinstance(data, pandas.DataFrame):
+
+            for page in data:
+
+                page = pandas.DataFrame(page)
+
+                if type == "tweets":
+
+                    page = _flatten_metrics(page)
+
+                self.df_to_db(id, page, type, **kwargs)
+
+            stored = None
+
+            if type == "query":
+
+                stored = self._pending_watermark(kwargs.get("query_term", ""))
+
+            if stored is not None:
+
+                if self.writer is not None and not kwargs.get("sync", False):
+
+                    self.writer.flush()
+
+                stored()
+
+            return
+
+        try:
+
+            query_term = kwargs["query_term"]
+
+        except KeyError:
+
+            query_term = ""
+
+        if type == "profile":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "profile"
+
+        elif type == "tweets":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "tweets"
+
+        elif type == "following":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "following"
+
+        elif type == "followers":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "followers"
+
+        elif type == "query":
+
+            engine = engines.get("data/twitter_queries.db")
+
+            table_name = query_table
+
+            data.insert(0, "transaction_id", [id for i in range(len(data))])
+
+            data.insert(0, "query_term", [query_term for i in range(len(data))])
+
+        else:
+
+            raise ValueError("type must be one of: profile, tweets, following, query")
+
+        captured = datetime.datetime.now()
+
+        try:
+
+            data.insert(0, "capture_timestamp", [captured for i in range(len(data))])
+
+        except ValueError:  # work-around to avoid producing a Nonetype DataFrame
+
+            data.drop(labels="capture_timestamp", axis=1, inplace=True)
+
+            data.insert(0, "capture_timestamp", [captured for i in range(len(data))])
+
+        data, dtype = _apply_schema(data.sort_index(), type)
+
+        stored = self._pending_watermark(query_term) if type == "query" else None
+
+        if kwargs.get("backend", self.backend) == "parquet":
+
+            _write_parquet(id, data, type)
+
+        elif self.writer is not None and not kwargs.get("sync", False):
+
+            self.writer.put(engine, str(table_name), data, type, dtype, stored)
+
+            return
+
+        else:
+
+            _write(engine, str(table_name), data, type, dtype)
+
+        if stored is not None:
+
+            stored()
+
+    def _pending_watermark(self, query_term: str):
+
+        """
+        Take the incremental poll's mark for a query term, stored raw or parsed, as a call that sets it. None if there is none.
+        """
+
+        mark = self.pending_watermarks.pop(query_term, None)
+
+        if mark is None:
+
+            mark = self.pending_watermarks.pop(urllib.parse.quote(query_term), None)
+
+        return None if mark is None else functools.partial(self.watermarks.set, *mark)
+
+    def db_to_df(self, id: str, type: str, **kwargs) -> pandas.DataFrame:
+
+        """
+        Read a user's data from a specified database into a pandas DataFrame.
+
+        Filters are compiled into the SQL, so only matching rows and columns are read. With `chunksize`, rows are streamed in bounded-size DataFrames instead of loaded at once. A user's rows merged into a shard by Database_Functions.maintain() are read together with those written since.
+
+        #### Paramters
+
+            id : str - The user id of the profile. Can be referenced from the dataframe, or passed as string. For a query, the 'x-transaction-id' of one capture, or None for every capture.
+
+            type : str - profile, tweets, following, query
+
+            columns : list[str] - Read just these columns. Default: all.
+
+            query_term : str - Query only. Return captures of this term, parsed or not.
+
+            start : datetime | str - Return rows whose time_column is at or after this time.
+
+            end : datetime | str - Return rows whose time_column is before this time.
+
+            time_column : str - The column start and end apply to, e.g. 'created_at'. Default 'capture_timestamp' for every type.
+
+            since_id : int | str - Return rows with an id greater than this.
+
+            until_id : int | str - Return rows with an id less than this.
+
+            limit : int - Return at most this many rows.
+
+            chunksize : int - Return an iterator of DataFrames of this many rows.
+
+            backend : str - 'sqlite' or 'parquet'. Default self.backend. Parquet reads prune partitions and row groups with the same filters; id may be None to read every user.
+
+        #### Example
+
+            `t1.db_to_df(None, 'query', query_term='musk', start='2022-11-01')`
+            `t1.db_to_df(None, 'query', backend='parquet', columns=['created_at', 'text'])`
+            `for df in t1.db_to_df(user_id, 'followers', columns=['id', 'followers_count'], chunksize=50000): ...`
+        """
+
+        if kwargs.get("backend", self.backend) == "parquet":
+
+            return _read_parquet(id, type, **kwargs)
+
+        if type == "profile":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "profile"
+
+        elif type == "tweets":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "tweets"
+
+        elif type == "following":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "following"
+
+        elif type == "followers":
+
+            engine = engines.get(f"data/{id}.db")
+
+            table_name = "followers"
+
+        elif type == "query":
+
+            engine = engines.get("data/twitter_queries.db")
+
+            table_name = query_table
+
+        else:
+
+            raise ValueError("type must be one of: profile, tweets, following, query")
+
+        if type != "query":
+
+            sources = _user_sources(id, table_name)
+
+            if sources:
+
+                return _read_user(id, table_name, sources, **kwargs)
+
+        table = sqlalchemy.Table(
+            table_name, sqlalchemy.MetaData(), autoload_with=engine
+        )
+
+        statement = _select(table, **kwargs)
+
+        if type == "query":
+
+            if id is not None:
+
+                statement = statement.where(table.c.transaction_id == str(id))
+
+            statement = statement.order_by(table.c.capture_timestamp)
+
+        return pandas.read_sql_query(
+            statement, con=engine, chunksize=kwargs.get("chunksize")
+        )
+
+    def get_dbs(self):
+
+        """
+        Retrieve Twitter databases. Uses regex to check file names for an expected convention.
+
+        This will be deprecated by class Database_Functions.
+
+        Returns
+
+            A list of database files by user id.
+        """
+
+        files = list(catalog.refresh())
+
+        l = [
+            re.search(r"(\d+.db)", i) for i in files
+        ]  # regex for any files consisting of [0-9].db
+
+        processed_list = [x for x in l if x is not None]
+
+        return processed_list
+
+    def tweet_log(self):
+
+        """
+        Tweet a log event of a specified schema.
+
+        Endpoint URL: https://api.twitter.com/2/tweets
+        Twitter Doc: https://developer.twitter.com/en/docs/twitter-api/tweets/manage-tweets/api-reference/post-tweets
+
+        Parameters:
+
+            schema : str - One of 'reading', 'programming', 'watching', 'researching', 'listening'.
+
+            hastags : list[str] - Hashtags to include in the Tweet.
+
+            mentions : list[str] - Usernames to mention in the Tweet. May include '@' or not.
+
+            emojis : list[str] - Emojis to include in the post. Can be markup shortcode or keyword.
+        """
+
+        # TODO test session.post function schema
+
+        self.post_url(
+            url=f'',
+        )
+
+
+class Transport:
+
+    """
+    Connection pooling, timeouts, and retries for a Twitter_Session.
+
+    Sessions built by a Transport keep connections alive in a sized pool and ask for compressed transfer. Requests carry connect/read timeouts, so a hung socket fails instead of stalling the caller, and 5xx responses, connection resets, and timeouts are retried with jittered exponential backoff. A URL without a scheme gets 'https://' before it is sent.
+
+    #### Parameters
+
+        pool_connections : int - Number of host pools to keep. Default 10.
+
+        pool_maxsize : int - Connections kept alive per host. Default 10.
+
+        timeout : tuple[float, float] - (connect, read) seconds. Default (5, 30).
+
+        retries : int - Retries after the first attempt. Default 5.
+
+        backoff : float - Base delay in seconds, doubled each retry. Default 0.5.
+
+        backoff_max : float - Cap on a single delay in seconds. Default 60.
+    """
+
+    retry_statuses = (500, 502, 503, 504)
+    """Server errors that are retried."""
+
+    def __init__(self, **kwargs):
+
+        self.pool_connections = kwargs.get("pool_connections", 10)
+
+        self.pool_maxsize = kwargs.get("pool_maxsize", 10)
+
+        self.timeout = kwargs.get("timeout", (5, 30))
+
+        self.retries = kwargs.get("retries", 5)
+
+        self.backoff = kwargs.get("backoff", 0.5)
+
+        self.backoff_max = kwargs.get("backoff_max", 60)
+
+    def session(self) -> requests.Session:
+
+        """
+        Build a requests.Session with a pooled adapter and keep-alive, compressed-transfer headers.
+        """
+
+        session = requests.Session()
+
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,
+        )
+
+        session.mount("https://", adapter)
+
+        session.mount("http://", adapter)
+
+        session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+
+        return session
+
+    def delay(self, attempt: int, response: requests.Response = None) -> float:
+
+        """
+        Seconds to wait before retry number `attempt`: the server's Retry-After if it sent one, else full jitter over an exponential window.
+        """
+
+        if response is not None and response.headers.get("retry-after", "").isdigit():
+
+            return min(float(response.headers["retry-after"]), self.backoff_max)
+
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+    def request(
+        self, session: requests.Session, method: str, url: str, **kwargs
+    ) -> requests.Response:
+
+        """
+        Send a request with timeouts and retries.
+
+        #### Parameters
+
+            session : requests.Session - A session built by session().
+
+            method : str - 'GET' or 'POST'.
+
+            url : str - The complete URL, with or without a scheme.
+
+            retry : bool - Default `True`. Set `False` for requests that are not safe to repeat.
+
+            history : collections.deque - If given, a record with the status, attempts, and latency is appended.
+
+            optional kwargs : dict - Passed to requests.Session.request().
+
+        #### Returns
+
+            requests.Response - The last response received. Raises the last connection error if every attempt failed to connect.
+        """
+
+        if "://" not in url:
+
+            url = f"https://{url}"
+
+        history = kwargs.pop("history", None)
+
+        retries = self.retries if kwargs.pop("retry", True) else 0
+
+        start = time.perf_counter()
+
+        for attempt in range(retries + 1):
+
+            try:
+
+                response = session.request(
+                    method, url, timeout=self.timeout, stream=False, **kwargs
+                )
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+
+                if attempt == retries:
+
+                    raise
+
+                time.sleep(self.delay(attempt))
+
+                continue
+
+            if response.status_code not in self.retry_statuses or attempt == retries:
+
+                break
+
+            time.sleep(self.delay(attempt, response))
+
+        if history is not None:
+
+            history.append(
+                {
+                    "timestamp": datetime.datetime.now(),
+                    "method": method,
+                    "url": url,
+                    "status_code": response.status_code,
+                    "attempts": attempt + 1,
+                    "latency": time.perf_counter() - start,
+                }
+            )
+
+        return response
+
+
+class Batch_Writer:
+
+    """
+    A write-behind queue for df_to_db(). The calling thread types each frame and queues it; one daemon thread takes everything queued, concatenates the frames bound for the same table, and commits each table in a single transaction.
+
+    #### Parameters
+
+        batch_rows : int - Rows collected before a batch is written without waiting further. Default 5000.
+
+        linger : float - Seconds to wait for more frames before writing a partial batch. Default 0.2.
+
+        max_pending : int - Frames queued before df_to_db() blocks. Default 256.
+    """
+
+    def __init__(self, **kwargs):
+
+        self.batch_rows = kwargs.get("batch_rows", 5000)
+
+        self.linger = kwargs.get("linger", 0.2)
+
+        self.pending = queue.Queue(maxsize=kwargs.get("max_pending", 256))
+
+        self.written = 0
+        """Rows committed so far."""
+
+        self.error = None
+
+        self.closed = False
+
+        self.thread = threading.Thread(
+            target=self._run, name="batch-writer", daemon=True
+        )
+
+        self.thread.start()
+
+    def put(
+        self,
+        engine,
+        table: str,
+        data: pandas.DataFrame,
+        type: str,
+        dtype: dict,
+        committed=None,
+    ):
+
+        """
+        Queue a typed frame. Blocks while the queue is full. If given, `committed` is called with no arguments once the frame is committed, and not at all if the write fails.
+        """
+
+        self._raise()
+
+        if self.closed:
+
+            raise RuntimeError("the writer is closed")
+
+        self.pending.put((engine, table, data, type, dtype, committed))
+
+    def flush(self) -> None:
+
+        """
+        Wait until every queued frame is committed.
+        """
+
+        self.pending.join()
+
+        self._raise()
+
+    def close(self) -> None:
+
+        """
+        Commit every queued frame and stop the thread.
+        """
+
+        if not self.closed:
+
+            self.closed = True
+
+            self.pending.put(None)
+
+            self.thread.join()
+
+        self._raise()
+
+    def _raise(self) -> None:
+
+        if self.error is not None:
+
+            error, self.error = self.error, None
+
+            raise error
+
+    def _run(self) -> None:
+
+        stop = False
+
+        while not stop:
+
+            item = self.pending.get()
+
+            batch = [] if item is None else [item]
+
+            stop = item is None
+
+            rows = 0 if item is None else len(item[2])
+
+            deadline = time.monotonic() + self.linger
+
+            while not stop and rows < self.batch_rows:
+
+                try:
+
+                    item = self.pending.get(timeout=max(0, deadline - time.monotonic()))
+
+                except queue.Empty:
+
+                    break
+
+                if item is None:
+
+                    stop = True
+
+                else:
+
+                    batch.append(item)
+
+                    rows += len(item[2])
+
+            self._write(batch)
+
+            for i in range(len(batch) + stop):
+
+                self.pending.task_done()
+
+    def _write(self, batch: list) -> None:
+
+        groups = {}
+
+        for engine, table, data, type, dtype, committed in batch:
+
+            frames, dtypes, callbacks = groups.setdefault(
+                (engine, table, type), ([], {}, [])
+            )
+
+            frames.append(data)
+
+            dtypes.update(dtype)
+
+            if committed is not None:
+
+                callbacks.append(committed)
+
+        for (engine, table, type), (frames, dtype, callbacks) in groups.items():
+
+            frame = pandas.concat(frames, ignore_index=True)
+
+            try:
+
+                _write(engine, table, frame, type, dtype)
+
+                self.written += sum(len(i) for i in frames)
+
+                for i in callbacks:
+
+                    i()
+
+            except Exception as error:  # surfaced by the next put(), flush() or close()
+
+                self.error = self.error or error
+
+
+class Rate_Limit_Scheduler:
+
+    """
+    Header-driven token buckets, one per endpoint.
+
+    Each bucket holds the `remaining` budget and `reset_at` time stamp reported by Twitter's x-rate-limit-* headers. A call with budget left passes straight through; an empty bucket blocks exactly until its reset. Thread-safe, so worker sessions can share one scheduler.
+
+    #### Attributes
+
+        buckets : dict - {endpoint: {'remaining': float, 'limit': float, 'reset_at': int}}
+
+        limits : dict - {endpoint: the last return_server_limits() dictionary}
+    """
+
+    def __init__(self):
+
+        self.buckets = {}
+
+        self.limits = {}
+
+        self._lock = threading.Lock()
+
+    def update(self, endpoint: str, limits: dict) -> None:
+
+        """
+        Refresh a bucket from a return_server_limits() dictionary.
+        """
+
+        with self._lock:
+
+            self.limits[endpoint] = limits
+
+            self.buckets[endpoint] = {
+                "remaining": limits["remaining"],
+                "limit": limits["limit"],
+                "reset_at": limits["reset_at"],
+            }
+
+    def blocked(self, endpoint: str) -> bool:
+
+        """
+        Whether the endpoint's bucket is empty until a reset still ahead, so wait() will sleep.
+        """
+
+        with self._lock:
+
+            bucket = self.buckets.get(endpoint)
+
+            return (
+                bucket is not None
+                and bucket["remaining"] < 1
+                and bucket["reset_at"] > time.time()
+            )
+
+    def wait(self, endpoint: str) -> float:
+
+        """
+        Take one call from the endpoint's bucket, sleeping until the reset if it is empty. Endpoints that have not been seen yet pass straight through.
+
+        #### Returns
+
+            float - Seconds slept.
+        """
+
+        slept = 0.0
+
+        while True:
+
+            with self._lock:
+
+                bucket = self.buckets.get(endpoint)
+
+                if bucket is None:
+
+                    return slept
+
+                now = time.time()
+
+                if now >= bucket["reset_at"]:
+
+                    bucket["remaining"] = bucket["limit"]
+
+                    bucket["reset_at"] = now + 900
+
+                if bucket["remaining"] >= 1:
+
+                    bucket["remaining"] -= 1
+
+                    return slept
+
+                delay = bucket["reset_at"] - now + 1
+
+            print(f"sleeping...-_-... {endpoint} resets in {round(delay)}s")
+
+            time.sleep(delay)
+
+            slept += delay
+
+
+class Response_Cache:
+
+    """
+    On-disk cache of GET responses, stored in SQLite.
+
+    Entries are keyed by the normalized URL (scheme added, query parameters sorted) and a hash of the bearer token, so two credentials never share entries. Each endpoint has its own time to live. When the stored bodies exceed `max_bytes`, the least recently used entries are evicted. Only 200 responses are stored.
+
+    #### Parameters
+
+        path : str - The cache database. Default 'data/http_cache.db'.
+
+        ttl : dict - Seconds to live per endpoint, merged over Response_Cache.ttl.
+
+        max_bytes : int - Upper bound on stored body size. Default 256 MB.
+
+        offline : bool - Default `False`. If `True`, serve every entry regardless of age and raise ConnectionError on a miss instead of touching the network. Replays a cached crawl.
+    """
+
+    ttl = {
+        "user_profile": 3600,
+        "user_profiles": 3600,
+        "user_tweets": 900,
+        "user_following": 3600,
+        "user_followers": 3600,
+        "query": 300,
+        "default": 600,
+    }
+    """Default seconds to live per endpoint."""
+
+    def __init__(self, path: str = "data/http_cache.db", **kwargs):
+
+        self.path = path
+
+        self.ttl = {**Response_Cache.ttl, **kwargs.get("ttl", {})}
+
+        self.max_bytes = kwargs.get("max_bytes", 256 * 1024 * 1024)
+
+        self.offline = kwargs.get("offline", False)
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS http_cache "
+                    "(key TEXT PRIMARY KEY, url TEXT, endpoint TEXT, status_code INTEGER, "
+                    "headers TEXT, body BLOB, size INTEGER, stored_at REAL, accessed_at REAL)"
+                )
+            )
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _key(self, url: str, token: str) -> str:
+
+        parts = urllib.parse.urlsplit(url if "://" in url else f"https://{url}")
+
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query)))
+
+        normalized = urllib.parse.urlunsplit(
+            (parts.scheme, parts.netloc.lower(), parts.path, query, "")
+        )
+
+        return f"{_token_id(token)}:{normalized}"
+
+    def _fresh(self, endpoint: str, stored_at: float) -> bool:
+
+        if self.offline:
+
+            return True
+
+        ttl = self.ttl.get(endpoint, self.ttl["default"])
+
+        return time.time() - stored_at < ttl
+
+    def contains(self, url: str, token: str) -> bool:
+
+        """
+        `True` if a fresh entry exists for the URL.
+        """
+
+        with self.engine.connect() as conn:
+
+            row = conn.execute(
+                sqlalchemy.text(
+                    "SELECT endpoint, stored_at FROM http_cache WHERE key = :key"
+                ),
+                {"key": self._key(url, token)},
+            ).fetchone()
+
+        return row is not None and self._fresh(row[0], row[1])
+
+    def get(self, url: str, token: str):
+
+        """
+        Return a fresh cached Twitter_Response for the URL, or None.
+        """
+
+        key = self._key(url, token)
+
+        with self.engine.begin() as conn:
+
+            row = conn.execute(
+                sqlalchemy.text(
+                    "SELECT endpoint, status_code, headers, body, stored_at "
+                    "FROM http_cache WHERE key = :key"
+                ),
+                {"key": key},
+            ).fetchone()
+
+            if row is None or not self._fresh(row[0], row[4]):
+
+                if self.offline:
+
+                    raise requests.exceptions.ConnectionError(
+                        f"Offline cache has no entry for {url}"
+                    )
+
+                return None
+
+            conn.execute(
+                sqlalchemy.text(
+                    "UPDATE http_cache SET accessed_at = :now WHERE key = :key"
+                ),
+                {"now": time.time(), "key": key},
+            )
+
+        response = requests.Response()
+
+        response.status_code = row[1]
+
+        response.headers = requests.structures.CaseInsensitiveDict(json.loads(row[2]))
+
+        response._content = row[3]
+
+        response.url = url
+
+        return Twitter_Response(response, cached=True)
+
+    def put(self, url: str, token: str, response: requests.Response) -> None:
+
+        """
+        Store a 200 response, then evict least recently used entries over max_bytes.
+        """
+
+        if response.status_code != 200:
+
+            return
+
+        now = time.time()
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT OR REPLACE INTO http_cache "
+                    "(key, url, endpoint, status_code, headers, body, size, stored_at, accessed_at) "
+                    "VALUES (:key, :url, :endpoint, :status_code, :headers, :body, :size, :now, :now)"
+                ),
+                {
+                    "key": self._key(url, token),
+                    "url": url,
+                    "endpoint": _endpoint_of(url),
+                    "status_code": response.status_code,
+                    "headers": json.dumps(dict(response.headers)),
+                    "body": response.content,
+                    "size": len(response.content),
+                    "now": now,
+                },
+            )
+
+            total = conn.execute(
+                sqlalchemy.text("SELECT COALESCE(SUM(size), 0) FROM http_cache")
+            ).scalar()
+
+            if total <= self.max_bytes:
+
+                return
+
+            rows = conn.execute(
+                sqlalchemy.text(
+                    "SELECT key, size FROM http_cache ORDER BY accessed_at ASC"
+                )
+            ).fetchall()
+
+            for key, size in rows:
+
+                if total <= self.max_bytes:
+
+                    break
+
+                conn.execute(
+                    sqlalchemy.text("DELETE FROM http_cache WHERE key = :key"),
+                    {"key": key},
+                )
+
+                total -= size
+
+    def clear(self) -> None:
+
+        """
+        Drop every entry.
+        """
+
+        with self.engine.begin() as conn:
+
+            conn.execute(sqlalchemy.text("DELETE FROM http_cache"))
+
+
+class Token_Pool:
+
+    """
+    Several bearer tokens, each with its own Rate_Limit_Scheduler.
+
+    acquire() hands out the token with the most remaining budget for an endpoint. Tokens that have not called an endpoint yet count as full. A token whose budget is spent is rotated out until its reset; if every token is spent, the one that resets first is returned and its scheduler decides the wait.
+
+    #### Parameters
+
+        tokens : list[str] - The bearer tokens. Duplicates are kept once.
+
+    #### Attributes
+
+        schedulers : dict - {token: Rate_Limit_Scheduler}
+
+        limit_log : dict - {token id: {endpoint: return_server_limits() dictionary}}. Token ids are short hashes; the tokens themselves are never logged.
+    """
+
+    def __init__(self, tokens: list):
+
+        self.tokens = list(dict.fromkeys(tokens))
+
+        self.schedulers = {i: Rate_Limit_Scheduler() for i in self.tokens}
+
+        self._lock = threading.Lock()
+
+    @property
+    def limit_log(self) -> dict:
+
+        return {
+            _token_id(token): dict(scheduler.limits)
+            for token, scheduler in self.schedulers.items()
+        }
+
+    def _rank(self, token: str, endpoint: str, now: float) -> tuple:
+
+        bucket = self.schedulers[token].buckets.get(endpoint)
+
+        if bucket is None or now >= bucket["reset_at"]:
+
+            return (1, float("inf"))
+
+        if bucket["remaining"] >= 1:
+
+            return (1, bucket["remaining"])
+
+        return (0, -bucket["reset_at"])
+
+    def acquire(self, endpoint: str) -> str:
+
+        """
+        Return the token to use for the next call to an endpoint.
+        """
+
+        with self._lock:
+
+            now = time.time()
+
+            return max(self.tokens, key=lambda i: self._rank(i, endpoint, now))
+
+
+class Crawl_Checkpoints:
+
+    """
+    Pagination checkpoints in the `data/` SQLite store.
+
+    A crawl is keyed by endpoint and id, e.g. 'user_tweets/44196397'. The cursor table holds the next_token to request; the pages table holds every page completed so far, as JSON, so a resumed crawl can replay them without spending the request budget again.
+
+    #### Parameters
+
+        path : str - The database file. Default 'data/checkpoints.db'.
+    """
+
+    def __init__(self, path: str = "data/checkpoints.db"):
+
+        self.path = path
+
+        self._ready = False
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _setup(self) -> None:
+
+        if self._ready:
+
+            return
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS crawl_cursor "
+                    "(crawl TEXT PRIMARY KEY, next_token TEXT, pages INTEGER, updated_at TEXT)"
+                )
+            )
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS crawl_pages "
+                    "(crawl TEXT, page INTEGER, records TEXT, PRIMARY KEY (crawl, page))"
+                )
+            )
+
+        self._ready = True
+
+    def load(self, crawl: str):
+
+        """
+        Return (next_token, [page records, ...]) for a checkpointed crawl, or None if there is no checkpoint.
+        """
+
+        self._setup()
+
+        with self.engine.connect() as conn:
+
+            cursor = conn.execute(
+                sqlalchemy.text(
+                    "SELECT next_token FROM crawl_cursor WHERE crawl = :crawl"
+                ),
+                {"crawl": crawl},
+            ).fetchone()
+
+            if cursor is None:
+
+                return None
+
+            rows = conn.execute(
+                sqlalchemy.text(
+                    "SELECT records FROM crawl_pages WHERE crawl = :crawl ORDER BY page"
+                ),
+                {"crawl": crawl},
+            ).fetchall()
+
+        return cursor[0], [json.loads(i[0]) for i in rows]
+
+    def save(self, crawl: str, page: int, records: list, next_token: str) -> None:
+
+        """
+        Store one completed page and advance the cursor, in one transaction.
+        """
+
+        self._setup()
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT OR REPLACE INTO crawl_pages (crawl, page, records) "
+                    "VALUES (:crawl, :page, :records)"
+                ),
+                {"crawl": crawl, "page": page, "records": json.dumps(records)},
+            )
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT OR REPLACE INTO crawl_cursor (crawl, next_token, pages, updated_at) "
+                    "VALUES (:crawl, :next_token, :pages, :updated_at)"
+                ),
+                {
+                    "crawl": crawl,
+                    "next_token": next_token,
+                    "pages": page + 1,
+                    "updated_at": str(datetime.datetime.now()),
+                },
+            )
+
+    def clear(self, crawl: str) -> None:
+
+        """
+        Drop a crawl's cursor and pages.
+        """
+
+        self._setup()
+
+        with self.engine.begin() as conn:
+
+            for table in ("crawl_pages", "crawl_cursor"):
+
+                conn.execute(
+                    sqlalchemy.text(f"DELETE FROM {table} WHERE crawl = :crawl"),
+                    {"crawl": crawl},
+                )
+
+
+class Usage_Ledger:
+
+    """
+    Tweets consumed per billing period and endpoint, against the monthly tweet cap.
+
+    Every page of tweets read by a getter is recorded. The forecast extrapolates the period's consumption rate to the end of the period; when the cap would run out first, allowed() admits only work at or above the reserve priority, so low-priority polling stops before the cap does.
+
+    #### Parameters
+
+        path : str - The ledger database. Default 'data/usage_ledger.db'.
+
+        enrollment : str - The enrollment date, as in Twitter_Session.twitter_enrollment_period. Its day of month starts each billing period.
+
+        cap : int - Tweets per billing period.
+
+        reserve_priority : int - Highest priority number still allowed when the forecast runs out. Default 0.
+
+        min_window : float - Shortest span, in seconds, the consumption rate is averaged over. Default one day, so the first polls of a period do not forecast the cap away.
+    """
+
+    counted = ("user_tweets", "query")
+    """Endpoints whose results count toward the tweet cap."""
+
+    def __init__(self, path: str = "data/usage_ledger.db", **kwargs):
+
+        self.path = path
+
+        self.day = datetime.datetime.strptime(
+            kwargs.get("enrollment", "29 October"), "%d %B"
+        ).day
+
+        self.cap = kwargs.get("cap", 500000)
+
+        self.reserve_priority = kwargs.get("reserve_priority", 0)
+
+        self.min_window = kwargs.get("min_window", 86400)
+
+        self._ready = False
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _setup(self) -> None:
+
+        if self._ready:
+
+            return
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS usage_ledger "
+                    "(period_start TEXT, endpoint TEXT, tweets INTEGER, "
+                    "PRIMARY KEY (period_start, endpoint))"
+                )
+            )
+
+        self._ready = True
+
+    def _anchor(self, year: int, month: int) -> datetime.datetime:
+
+        """
+        The period start in a month, clamped to the month's last day. Months outside 1-12 roll into the neighbouring years.
+        """
+
+        year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+        return datetime.datetime(
+            year, month, min(self.day, calendar.monthrange(year, month)[1])
+        )
+
+    def period(self, now: datetime.datetime = None) -> tuple:
+
+        """
+        The (start, end) datetimes of the billing period containing `now`.
+        """
+
+        now = datetime.datetime.now() if now is None else now
+
+        start = self._anchor(now.year, now.month)
+
+        if start > now:
+
+            start = self._anchor(now.year, now.month - 1)
+
+        return start, self._anchor(start.year, start.month + 1)
+
+    def record(self, endpoint: str, tweets: int) -> None:
+
+        """
+        Add tweets consumed by one page. Endpoints outside `counted` are ignored.
+        """
+
+        if endpoint not in self.counted or tweets == 0:
+
+            return
+
+        self._setup()
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT INTO usage_ledger (period_start, endpoint, tweets) "
+                    "VALUES (:period_start, :endpoint, :tweets) "
+                    "ON CONFLICT (period_start, endpoint) "
+                    "DO UPDATE SET tweets = tweets + excluded.tweets"
+                ),
+                {
+                    "period_start": str(self.period()[0].date()),
+                    "endpoint": endpoint,
+                    "tweets": tweets,
+                },
+            )
+
+    def usage(self, now: datetime.datetime = None) -> dict:
+
+        """
+        {endpoint: tweets} consumed in the period containing `now`.
+        """
+
+        self._setup()
+
+        with self.engine.connect() as conn:
+
+            rows = conn.execute(
+                sqlalchemy.text(
+                    "SELECT endpoint, tweets FROM usage_ledger WHERE period_start = :period_start"
+                ),
+                {"period_start": str(self.period(now)[0].date())},
+            ).fetchall()
+
+        return dict(rows)
+
+    def forecast(self, now: datetime.datetime = None) -> dict:
+
+        """
+        Forecast the period at its current consumption rate, averaged over the time elapsed in the period or min_window, whichever is longer.
+
+        #### Returns
+
+            A dictionary with the following schema:
+
+                {
+                    'period_start': datetime,
+                    'period_end': datetime,
+                    'consumed': int,
+                    'remaining': int,
+                    'percent_consumed': int,
+                    'projected': int,
+                    'exhausted_at': datetime | None
+                    }
+
+            projected is the total expected by the end of the period. exhausted_at is when the cap runs out at the current rate, or None if it lasts the period.
+        """
+
+        now = datetime.datetime.now() if now is None else now
+
+        start, end = self.period(now)
+
+        consumed = sum(self.usage(now).values())
+
+        elapsed = max((now - start).total_seconds(), self.min_window, 1)
+
+        rate = consumed / elapsed
+
+        projected = int(consumed + rate * (end - now).total_seconds())
+
+        exhausted_at = None
+
+        if consumed >= self.cap:
+
+            exhausted_at = now
+
+        elif projected > self.cap:
+
+            exhausted_at = now + datetime.timedelta(
+                seconds=(self.cap - consumed) / rate
+            )
+
+        return {
+            "period_start": start,
+            "period_end": end,
+            "consumed": consumed,
+            "remaining": max(self.cap - consumed, 0),
+            "percent_consumed": int(consumed / self.cap * 100),
+            "projected": projected,
+            "exhausted_at": exhausted_at,
+        }
+
+    def allowed(self, priority: int = 0) -> bool:
+
+        """
+        `True` if work at `priority` should run. Everything runs while the forecast lasts the period; after that only priorities up to reserve_priority, until the cap is spent.
+        """
+
+        forecast = self.forecast()
+
+        if forecast["remaining"] == 0:
+
+            return False
+
+        return forecast["exhausted_at"] is None or priority <= self.reserve_priority
+
+
+class Query_Watermarks:
+
+    """
+    The newest tweet id seen per query term, stored in the `query_watermarks` table of the query store.
+
+    #### Parameters
+
+        path : str - The database file. Default 'data/twitter_queries.db'.
+    """
+
+    def __init__(self, path: str = "data/twitter_queries.db"):
+
+        self.path = path
+
+        self._ready = False
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _setup(self) -> None:
+
+        if self._ready:
+
+            return
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS query_watermarks "
+                    "(query_term TEXT PRIMARY KEY, newest_id TEXT, updated_at TEXT)"
+                )
+            )
+
+        self._ready = True
+
+    def get(self, query_term: str):
+
+        """
+        Return the term's newest seen id. A term that has not been polled incrementally falls back to the newest id stored for it in query_results, or None.
+        """
+
+        self._setup()
+
+        with self.engine.connect() as conn:
+
+            row = conn.execute(
+                sqlalchemy.text(
+                    "SELECT newest_id FROM query_watermarks WHERE query_term = :term"
+                ),
+                {"term": query_term},
+            ).fetchone()
+
+            if row is None and sqlalchemy.inspect(conn).has_table(query_table):
+
+                row = conn.execute(
+                    sqlalchemy.text(
+                        f"SELECT MAX(id) FROM {query_table} "
+                        "WHERE query_term IN (:term, :parsed)"
+                    ),
+                    {"term": query_term, "parsed": urllib.parse.quote(query_term)},
+                ).fetchone()
+
+        return None if row is None or row[0] is None else str(row[0])
+
+    def set(self, query_term: str, newest_id: str) -> None:
+
+        """
+        Advance the term's mark.
+        """
+
+        self._setup()
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT OR REPLACE INTO query_watermarks (query_term, newest_id, updated_at) "
+                    "VALUES (:term, :newest_id, :updated_at)"
+                ),
+                {
+                    "term": query_term,
+                    "newest_id": str(newest_id),
+                    "updated_at": str(datetime.datetime.now()),
+                },
+            )
+
+
+class Snapshot_Engine:
+
+    """
+    Concurrent fetch engine for a Twitter_Session.
+
+    Independent endpoint paginations run at the same time, each in a worker session spawned from the parent. Every endpoint has one lane; a lane admits one pagination at a time, so each endpoint stays within its own rate limit while the others keep fetching.
+
+    #### Parameters
+
+        session : Twitter_Session - A session with a token set. Its limit_log is updated as the workers finish.
+
+    #### Attributes
+
+        lanes : dict - An asyncio.Lock per endpoint. Created on first use, inside the running event loop.
+    """
+
+    endpoints = {
+        "profile": ("user_profile", "get_user_profile"),
+        "tweets": ("user_tweets", "get_user_tweets"),
+        "following": ("user_following", "get_user_following"),
+        "followers": ("user_followers", "get_user_followers"),
+    }
+    """Snapshot type mapped to its (limit_log endpoint, Twitter_Session method)."""
+
+    def __init__(self, session: Twitter_Session):
+
+        self.session = session
+
+        self.lanes = {}
+
+    def _lane(self, endpoint: str) -> asyncio.Lock:
+
+        if endpoint not in self.lanes:
+
+            self.lanes[endpoint] = asyncio.Lock()
+
+        return self.lanes[endpoint]
+
+    async def fetch(self, type: str, *args, **kwargs) -> pandas.DataFrame:
+
+        """
+        Run one getter in its endpoint's lane, on a worker thread.
+
+        #### Parameters
+
+            type : str - profile, tweets, following, followers
+
+            args, kwargs - Passed to the Twitter_Session getter.
+        """
+
+        endpoint, method = self.endpoints[type]
+
+        async with self._lane(endpoint):
+
+            worker = self.session._spawn()
+
+            df = await asyncio.to_thread(getattr(worker, method), *args, **kwargs)
+
+            self.session.limit_log.update(worker.limit_log)
+
+            self.session.response = worker.response
+
+            return df
+
+    async def snapshot(self, username: str, **kwargs) -> dict:
+
+        """
+        Snapshot one user: the profile first, then tweets, following, and followers concurrently. Each frame is written with df_to_db.
+
+        #### Parameters
+
+            username : str - The @username. Can be passed with or without '@'.
+
+            followers : bool - Gather followers. Default == `False`.
+
+            following : bool - Gather following. Default == `False`.
+
+            timer : bool - Passed through to each paginated getter.
+
+            resume : bool - Passed through to each paginated getter.
+
+            incremental : bool - Default `False`. If `True`, only fetch tweets newer than the newest one already stored for the user.
+
+        #### Returns
+
+            dict - The DataFrames written, keyed by type. If the profile lookup fails, only the error frame is returned under 'profile'.
+        """
+
+        timer = kwargs.get("timer", False)
+
+        resume = kwargs.get("resume", False)
+
+        df = await self.fetch("profile", username, timer=timer)
+
+        if "id" not in df.columns:
+
+            return {"profile": df}
+
+        user_id = df["id"][0]
+
+        types = ["tweets"]
+
+        if kwargs.get("following", False):
+
+            types.append("following")
+
+        if kwargs.get("followers", False):
+
+            types.append("followers")
+
+        options = {i: {"timer": timer, "resume": resume} for i in types}
+
+        if kwargs.get("incremental", False):
+
+            options["tweets"]["since_id"] = await asyncio.to_thread(
+                self.session.newest_tweet_id, user_id
+            )
+
+        frames = await asyncio.gather(
+            *[self.fetch(i, user_id, **options[i]) for i in types]
+        )
+
+        result = {"profile": df, **dict(zip(types, frames))}
+
+        for type, data in result.items():
+
+            if len(data):
+
+                await asyncio.to_thread(self.session.df_to_db, user_id, data, type)
+
+        return result
+
+    async def snapshot_many(self, usernames: list, **kwargs) -> dict:
+
+        """
+        Snapshot many users concurrently. See snapshot() for kwargs.
+
+        One account failing does not cancel the others: its exception is recorded in session.snapshot_errors and printed, and the rest are returned.
+
+        #### Returns
+
+            dict - {username: {type: pandas.DataFrame}} for the accounts snapshotted.
+        """
+
+        results = await asyncio.gather(
+            *[self.snapshot(i, **kwargs) for i in usernames], return_exceptions=True
+        )
+
+        snapshots, errors = {}, {}
+
+        for username, result in zip(usernames, results):
+
+            if isinstance(result, Exception):
+
+                print(f"Snapshot of {username} failed: {result!r}")
+
+                errors[username] = result
+
+            elif isinstance(result, BaseException):
+
+                raise result
+
+            else:
+
+                snapshots[username] = result
+
+        self.session.snapshot_errors = errors
+
+        return snapshots
+
+
+class Keyword_Scheduler:
+
+    """
+    Config-driven keyword polling.
+
+    Each term in the config has a priority and a cadence. Due terms are polled through a worker pool, highest priority (lowest number) first, with incremental get_string_query() calls written to the query store. The next run of every term is persisted, so a restart only polls what is due.
+
+    Adaptive terms (the default) are polled at their tweet velocity instead of the fixed cadence: the arrival rate is estimated from the created_at times of each poll, seeded from the stored query history, and the interval is chosen so one poll fills about `fill` of its pages. The fixed cadence is used until a rate is known.
+
+    Config schema (JSON):
+
+        {'workers': 4,
+
+            'terms': [
+
+                {'term': 'china', 'priority': 0, 'cadence': 25228, 'pages': 1,
+
+                    'adaptive': true, 'min_cadence': 60, 'max_cadence': 518400}
+
+                ]}
+
+    #### Parameters
+
+        session : Twitter_Session - A session with a token set. Each poll runs on a worker spawned from it.
+
+        config : str - File path to the config JSON.
+
+        state : str - The schedule database. Default 'data/keyword_schedule.db'.
+
+    #### Attributes
+
+        terms : dict - {term: {'priority', 'cadence', 'pages', 'adaptive', 'min_cadence', 'max_cadence', 'next_run', 'last_run', 'last_count', 'rate'}}. The rate is in tweets per second.
+
+        stop : threading.Event - Set to shut down after the in-flight polls finish.
+    """
+
+    defaults = {
+        "priority": 0,
+        "cadence": 25228,
+        "pages": 1,
+        "adaptive": True,
+        "min_cadence": 60,
+        "max_cadence": 518400,
+    }
+    """Per-term settings used when the config leaves them out. Cadences are in seconds; the recent search endpoint reaches back seven days, so the longest default interval is six."""
+
+    fill = 0.8
+    """Target share of a poll's pages to fill. Below 1, so a burst does not overflow into a gap."""
+
+    smoothing = 0.3
+    """Weight of the newest rate sample in the moving average."""
+
+    def __init__(self, session: Twitter_Session, config: str, **kwargs):
+
+        self.session = session
+
+        with open(file=config, mode="r") as file:
+
+            temp = json.loads(file.read())
+
+        self.workers = temp.get("workers", 4)
+
+        self.terms = {
+            i["term"]: {**Keyword_Scheduler.defaults, **i}
+            for i in temp.get("terms", [])
+        }
+
+        if not self.terms:
+
+            raise ValueError(f"{config} has no terms to poll")
+
+        self.path = kwargs.get("state", "data/keyword_schedule.db")
+
+        self.stop = threading.Event()
+
+        self._load_state()
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _load_state(self) -> None:
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS keyword_schedule "
+                    "(query_term TEXT PRIMARY KEY, last_run REAL, next_run REAL, last_count INTEGER, rate REAL)"
+                )
+            )
+
+            columns = [
+                i[1]
+                for i in conn.execute(
+                    sqlalchemy.text("PRAGMA table_info(keyword_schedule)")
+                )
+            ]
+
+            if "rate" not in columns:
+
+                conn.execute(
+                    sqlalchemy.text("ALTER TABLE keyword_schedule ADD COLUMN rate REAL")
+                )
+
+            rows = conn.execute(
+                sqlalchemy.text(
+                    "SELECT query_term, last_run, next_run, last_count, rate FROM keyword_schedule"
+                )
+            ).fetchall()
+
+        state = {i[0]: i[1:] for i in rows}
+
+        for term, settings in self.terms.items():
+
+            last_run, next_run, last_count, rate = state.get(
+                term, (None, 0.0, None, None)
+            )
+
+            settings.update(
+                {
+                    "last_run": last_run,
+                    "next_run": next_run,
+                    "last_count": last_count,
+                    "rate": rate,
+                }
+            )
+
+        unknown = [
+            i for i, j in self.terms.items() if j["adaptive"] and j["rate"] is None
+        ]
+
+        if unknown:
+
+            rates = self.history_rates()
+
+            for term in unknown:
+
+                self.terms[term]["rate"] = rates.get(urllib.parse.quote(term))
+
+    def history_rates(self, path: str = "data/twitter_queries.db") -> dict:
+
+        """
+        Estimate each term's arrival rate from the stored query history.
+
+        Every capture (one query_term, captured within one minute) spans the created_at range of the tweets it returned; its rate is the tweet count over that span. The median over a term's captures is returned. Captures are aggregated in SQL over query_results; per-transaction tables from older versions are only seen after Database_Functions.migrate_query_tables().
+
+        #### Returns
+
+            dict - {parsed query term: tweets per second}
+        """
+
+        if not os.path.exists(path):
+
+            return {}
+
+        engine = engines.get(path)
+
+        with engine.connect() as conn:
+
+            if not sqlalchemy.inspect(conn).has_table(query_table):
+
+                return {}
+
+            captures = pandas.read_sql_query(
+                sqlalchemy.text(
+                    "SELECT query_term, substr(capture_timestamp, 1, 16) AS capture_minute, "
+                    "COUNT(created_at) AS count, MIN(created_at) AS first, MAX(created_at) AS last "
+                    f"FROM {query_table} GROUP BY query_term, capture_minute"
+                ),
+                conn,
+            )
+
+        if not len(captures):
+
+            return {}
+
+        span = (
+            (_to_datetime(captures["last"]) - _to_datetime(captures["first"]))
+            .dt.total_seconds()
+            .clip(lower=1)
+        )
+
+        rates = (captures["count"] / span).groupby(captures["query_term"])
+
+        return rates.median().to_dict()
+
+    def observe(self, term: str, df: pandas.DataFrame, now: float) -> None:
+
+        """
+        Update the term's rate from one poll. A full poll only shows the span its tweets cover; a partial poll saw every tweet since the last run.
+        """
+
+        settings = self.terms[term]
+
+        full = len(df) >= 100 * settings["pages"]
+
+        dated = len(df) > 0 and "created_at" in df.columns
+
+        if dated and (full or not settings["last_run"]):
+
+            created_at = pandas.to_datetime(df["created_at"], utc=True)
+
+            span = (created_at.max() - created_at.min()).total_seconds()
+
+            sample = len(df) / max(span, 1)
+
+        elif settings["last_run"]:
+
+            sample = len(df) / max(now - settings["last_run"], 1)
+
+        else:
+
+            return
+
+        if settings["rate"] is None:
+
+            settings["rate"] = sample
+
+        else:
+
+            settings["rate"] = (
+                self.smoothing * sample + (1 - self.smoothing) * settings["rate"]
+            )
+
+    def _save_state(self, term: str) -> None:
+
+        settings = self.terms[term]
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "INSERT OR REPLACE INTO keyword_schedule "
+                    "(query_term, last_run, next_run, last_count, rate) "
+                    "VALUES (:term, :last_run, :next_run, :last_count, :rate)"
+                ),
+                {
+                    "term": term,
+                    "last_run": settings["last_run"],
+                    "next_run": settings["next_run"],
+                    "last_count": settings["last_count"],
+                    "rate": settings["rate"],
+                },
+            )
+
+    def due(self, now: float = None) -> list:
+
+        """
+        The terms due at `now`, highest priority first, then most overdue first.
+        """
+
+        now = time.time() if now is None else now
+
+        due = [i for i, j in self.terms.items() if j["next_run"] <= now]
+
+        return sorted(
+            due, key=lambda i: (self.terms[i]["priority"], self.terms[i]["next_run"])
+        )
+
+    def interval(self, term: str) -> float:
+
+        """
+        Seconds until the term's next poll. Adaptive terms with a known rate wait long enough for about `fill` of a poll's pages to arrive, within their min and max cadence.
+        """
+
+        settings = self.terms[term]
+
+        if not settings["adaptive"] or not settings["rate"]:
+
+            return settings["cadence"]
+
+        seconds = self.fill * 100 * settings["pages"] / settings["rate"]
+
+        return min(max(seconds, settings["min_cadence"]), settings["max_cadence"])
+
+    def poll(self, term: str) -> pandas.DataFrame:
+
+        """
+        Poll one term on a worker session and write any new tweets to the query store.
+        """
+
+        worker = self.session._spawn()
+
+        df = worker.get_string_query(
+            term, pages=self.terms[term]["pages"], incremental=True
+        )
+
+        if len(df):
+
+            worker.df_to_db(
+                id=worker.response.headers["x-transaction-id"],
+                data=df,
+                type="query",
+                query_term=urllib.parse.quote(term),
+            )
+
+        self.session.limit_log.update(worker.limit_log)
+
+        return df
+
+    def _done(self, term: str, future: concurrent.futures.Future) -> None:
+
+        settings = self.terms[term]
+
+        now = time.time()
+
+        try:
+
+            df = future.result()
+
+            self.observe(term, df, now)
+
+            settings["last_count"] = len(df)
+
+            print(f"{term}: {len(df)} new tweets")
+
+        except UsageCapExceeded as err:
+
+            print(f"{err} Stopping.")
+
+            self.stop.set()
+
+        except Exception as err:
+
+            print(f"{term}: {type(err).__name__} {err}")
+
+        settings["last_run"] = now
+
+        settings["next_run"] = now + self.interval(term)
+
+        self._save_state(term)
+
+    def _defer(self, term: str) -> None:
+
+        settings = self.terms[term]
+
+        settings["next_run"] = time.time() + self.interval(term)
+
+        print(f"{term}: deferred, the tweet cap forecast runs out early")
+
+        self._save_state(term)
+
+    def run(self, **kwargs) -> None:
+
+        """
+        Poll due terms until stop is set. Terms whose priority the session's usage ledger does not allow are deferred by one interval. In-flight polls are finished before returning.
+
+        #### Parameters
+
+            once : bool - Default `False`. If `True`, poll what is due once and return.
+
+            handle_signals : bool - Default `True`. Set stop on SIGINT/SIGTERM while running; the previous handlers are restored on return. Only possible from the main thread.
+        """
+
+        handlers = {}
+
+        if kwargs.get("handle_signals", True) and (
+            threading.current_thread() is threading.main_thread()
+        ):
+
+            for i in (signal.SIGINT, signal.SIGTERM):
+
+                handlers[i] = signal.signal(i, lambda signum, frame: self.stop.set())
+
+        try:
+
+            self._run(**kwargs)
+
+        finally:
+
+            for i, handler in handlers.items():
+
+                signal.signal(i, handler)
+
+    def _run(self, **kwargs) -> None:
+
+        in_flight = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+
+            while not self.stop.is_set():
+
+                for term in self.due():
+
+                    if term in in_flight or len(in_flight) >= self.workers:
+
+                        continue
+
+                    if not self.session.ledger.allowed(self.terms[term]["priority"]):
+
+                        self._defer(term)
+
+                        continue
+
+                    in_flight[term] = pool.submit(self.poll, term)
+
+                if kwargs.get("once", False):
+
+                    concurrent.futures.wait(in_flight.values())
+
+                if in_flight:
+
+                    finished, _ = concurrent.futures.wait(
+                        in_flight.values(),
+                        timeout=1,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+
+                    for term in [i for i, j in in_flight.items() if j in finished]:
+
+                        self._done(term, in_flight.pop(term))
+
+                if kwargs.get("once", False) and not in_flight and not self.due():
+
+                    break
+
+                if not in_flight:
+
+                    next_run = min(i["next_run"] for i in self.terms.values())
+
+                    self.stop.wait(min(max(next_run - time.time(), 0), 60))
+
+            for term, future in in_flight.items():
+
+                self._done(term, future)
+
+
+class Database_Catalog:
+
+    """
+    Table names, row counts and columns of every database file, kept in `catalog_entries` of data/catalog.db and in memory.
+
+    An entry is keyed by the file's size and mtime, and those of its WAL, taken before the scan, so refresh() only rescans files written since; a write during a scan is picked up by the next refresh. Files are scanned read-only. Full-text index tables are left out.
+
+    #### Parameters
+
+        path : str - The catalog database. Default 'data/catalog.db'. Excluded from its own scan.
+
+        pattern : str - Glob of the files to catalog. Default 'data/*.db'.
+    """
+
+    def __init__(self, path: str = "data/catalog.db", pattern: str = "data/*.db"):
+
+        self.path = path
+
+        self.pattern = pattern
+
+        self.entries = None
+        """{file: {'signature': list, 'tables': dict}}, loaded on first use."""
+
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> sqlalchemy.engine.Engine:
+
+        return engines.get(self.path)
+
+    def _load(self) -> None:
+
+        with self.engine.begin() as conn:
+
+            conn.execute(
+                sqlalchemy.text(
+                    "CREATE TABLE IF NOT EXISTS catalog_entries "
+                    "(file TEXT PRIMARY KEY, signature TEXT, tables TEXT)"
+                )
+            )
+
+            rows = conn.execute(
+                sqlalchemy.text("SELECT file, signature, tables FROM catalog_entries")
+            ).fetchall()
+
+        self.entries = {
+            file: {"signature": json.loads(signature), "tables": json.loads(tables)}
+            for file, signature, tables in rows
+        }
+
+    def _signature(self, file: str) -> list:
+
+        """
+        Size and mtime of a file and its WAL. An empty WAL is created and removed by readers, so only its size counts.
+        """
+
+        stat = os.stat(file)
+
+        try:
+
+            wal = os.stat(f"{file}-wal")
+
+            wal = [wal.st_size, wal.st_mtime_ns if wal.st_size else 0]
+
+        except FileNotFoundError:
+
+            wal = [0, 0]
+
+        return [stat.st_size, stat.st_mtime_ns] + wal
+
+    def _scan(self, file: str) -> dict:
+
+        """
+        Read a file's tables over a read-only connection, without the registry's pragmas, so listing a file never changes its journal mode or contents.
+        """
+
+        tables = {}
+
+        conn = sqlite3.connect(
+            f"file:{urllib.parse.quote(os.path.abspath(file))}?mode=ro", uri=True
+        )
+
+        try:
+
+            rows = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+
+            virtual = [name for name, sql in rows if "VIRTUAL TABLE" in (sql or "")]
+
+            for name, sql in rows:
+
+                if any(name == i or name.startswith(f"{i}_") for i in virtual):
+
+                    continue
+
+                columns = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+
+                count = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()
+
+                tables[name] = {
+                    "rows": count[0],
+                    "columns": {i[1]: i[2] for i in columns},
+                }
+
+        finally:
+
+            conn.close()
+
+        return tables
+
+    def refresh(self, files: list = None) -> dict:
+
+        """
+        Rescan new and changed files and drop the entries of deleted ones.
+
+        #### Parameters
+
+            files : list[str] - Only check these files. Default: every file matching the pattern.
+
+        #### Returns
+
+            dict - {file: {table: {'rows', 'columns'}}} for the checked files.
+        """
+
+        with self._lock:
+
+            if self.entries is None:
+
+                self._load()
+
+            if files is None:
+
+                files = glob.glob(self.pattern)
+
+            own = os.path.abspath(self.path)
+
+            files = sorted(
+                {
+                    os.path.normpath(i)
+                    for i in files
+                    if os.path.exists(i) and os.path.abspath(i) != own
+                }
+            )
+
+            changed = {}
+
+            for file in files:
+
+                entry = self.entries.get(file)
+
+                signature = self._signature(file)
+
+                if entry is None or entry["signature"] != signature:
+
+                    changed[file] = {"signature": signature, "tables": self._scan(file)}
+
+            removed = [i for i in self.entries if not os.path.exists(i)]
+
+            if changed or removed:
+
+                with self.engine.begin() as conn:
+
+                    for file, entry in changed.items():
+
+                        conn.execute(
+                            sqlalchemy.text(
+                                "INSERT OR REPLACE INTO catalog_entries (file, signature, tables) "
+                                "VALUES (:file, :signature, :tables)"
+                            ),
+                            {
+                                "file": file,
+                                "signature": json.dumps(entry["signature"]),
+                                "tables": json.dumps(entry["tables"]),
+                            },
+                        )
+
+                    for file in removed:
+
+                        conn.execute(
+                            sqlalchemy.text(
+                                "DELETE FROM catalog_entries WHERE file = :file"
+                            ),
+                            {"file": file},
+                        )
+
+            self.entries.update(changed)
+
+            for file in removed:
+
+                del self.entries[file]
+
+            return {i: self.entries[i]["tables"] for i in files}
+
+
+@dataclass
+class Database_Functions:
+    def __init__(self):
+
+        """Database functions."""
+
+    def list_db_keys(self):
+
+        """
+        The table names of every data/*.db file, from the catalog.
+
+        #### Returns
+
+            list[tuple] - (table names, file) per database.
+        """
+
+        return [(list(tables), file) for file, tables in catalog.refresh().items()]
+
+    def migrate_storage(self, files: list = None) -> list:
+
+        """
+        Rewrite stored tables written as all-TEXT by older versions of df_to_db() into the typed storage_schemas, in place.
+
+        Tables are recognised by name (profile, tweets, following, followers) or, in the query store, by a query_term column. Other tables, and tables whose declared types already match the schema, are left alone. Each table is rewritten in one transaction.
+
+        #### Parameters
+
+            files : list[str] - Database files. Default: every data/*.db.
+
+        #### Returns
+
+            list[tuple] - (file, table, type, rows) for every migrated table.
+        """
+
+        report = []
+
+        for file in files if files is not None else glob.glob("data/*.db"):
+
+            engine = engines.get(file)
+
+            inspector = sqlalchemy.inspect(engine)
+
+            for table in inspector.get_table_names():
+
+                columns = {i["name"] for i in inspector.get_columns(table)}
+
+                if table in ("profile", "tweets", "following", "followers"):
+
+                    type = table
+
+                elif "query_term" in columns and "capture_timestamp" in columns:
+
+                    type = "query"
+
+                else:
+
+                    continue
+
+                if _typed(inspector.get_columns(table), type):
+
+                    continue
+
+                df, dtype = _apply_schema(_read_stored(engine, table), type)
+
+                with engine.begin() as conn:
+
+                    df.to_sql(
+                        name=f"{table}__typed", con=conn, index=False, dtype=dtype
+                    )
+
+                    conn.execute(sqlalchemy.text(f'DROP TABLE "{table}"'))
+
+                    conn.execute(
+                        sqlalchemy.text(
+                            f'ALTER TABLE "{table}__typed" RENAME TO "{table}"'
+                        )
+                    )
+
+                    if type in storage_keys:
+
+                        _add_key(conn, table, storage_keys[type])
+
+                    if type in ("tweets", "query") and "text" in df.columns:
+
+                        _index_text(conn, table, rebuild=True)
+
+                if table == query_table:
+
+                    _index_query_table(engine)
+
+                report.append((file, table, type, len(df)))
+
+        return report
+
+    def migrate_query_tables(self, path: str = "data/twitter_queries.db") -> list:
+
+        """
+        Move the per-x-transaction-id tables written by older versions of df_to_db() into the single indexed query_results table. Each table is appended, with its name as transaction_id, and dropped in one transaction.
+
+        #### Parameters
+
+            path : str - The query store. Default 'data/twitter_queries.db'.
+
+        #### Returns
+
+            list[tuple] - (table, rows) for every moved table.
+        """
+
+        engine = engines.get(path)
+
+        report = []
+
+        for table in sqlalchemy.inspect(engine).get_table_names():
+
+            columns = {i["name"] for i in sqlalchemy.inspect(engine).get_columns(table)}
+
+            if table == query_table:
+
+                continue
+
+            if not {"query_term", "capture_timestamp"} <= columns:
+
+                continue
+
+            df = _read_stored(engine, table)
+
+            if "transaction_id" not in df.columns:
+
+                df.insert(1, "transaction_id", table)
+
+            df, dtype = _apply_schema(df, "query")
+
+            _add_missing_columns(engine, query_table, dtype)
+
+            with engine.begin() as conn:
+
+                _store(conn, query_table, df, "query", dtype)
+
+                conn.execute(sqlalchemy.text(f'DROP TABLE "{table}"'))
+
+            report.append((table, len(df)))
+
+        if sqlalchemy.inspect(engine).has_table(query_table):
+
+            _index_query_table(engine)
+
+        return report
+
+    def build_search_index(self, files: list = None) -> list:
+
+        """
+        Create or rebuild the full-text index of every tweets and query_results table. df_to_db() keeps the index in sync once it exists; run this for stores written before it did, or after a VACUUM, which may renumber rows.
+
+        #### Parameters
+
+            files : list[str] - Database files. Default: every data/*.db.
+
+        #### Returns
+
+            list[tuple] - (file, table) for every indexed table.
+        """
+
+        report = []
+
+        for file in files if files is not None else glob.glob("data/*.db"):
+
+            engine = engines.get(file)
+
+            with engine.begin() as conn:
+
+                inspector = sqlalchemy.inspect(conn)
+
+                for table in ("tweets", query_table):
+
+                    if not inspector.has_table(table):
+
+                        continue
+
+                    if "text" not in {i["name"] for i in inspector.get_columns(table)}:
+
+                        continue
+
+                    _index_text(conn, table, rebuild=True)
+
+                    report.append((file, table))
+
+        return report
+
+    def search(self, match: str, **kwargs) -> pandas.DataFrame:
+
+        """
+        Ranked full-text search over stored tweet text, using the FTS5 index df_to_db() maintains.
+
+        Every user database, every shard and the query store are searched unless narrowed by the filters below. Matches are ranked by bm25; lower is better. A user's tweet held in both their own database and their shard is returned once, from the database.
+
+        #### Parameters
+
+            match : str - An FTS5 query: words, "exact phrases", prefix*, AND, OR, NOT, NEAR().
+
+            query_term : str - Only search query captures of this term, parsed or not. User databases are skipped.
+
+            user_id : str | list[str] - Only search these users' databases and shard rows, and tweets by these authors in the query store. Query captures stored without an author_id column are skipped.
+
+            start : datetime | str - Only tweets created at or after this time. Tables stored without created_at are skipped by start and end.
+
+            end : datetime | str - Only tweets created before this time.
+
+            limit : int - Maximum matches returned. Default 100.
+
+            markers : tuple[str, str] - Put around matched words in the snippet. Default ('**', '**').
+
+        #### Returns
+
+            pandas.DataFrame - One row per match: source (database file), rank, snippet, and the stored tweet columns.
+
+        #### Example
+
+            `Database_Functions().search('"supply chain" OR semiconductor*', query_term='taiwan', start='2022-11-01')`
+        """
+
+        limit = kwargs.get("limit", 100)
+
+        users = kwargs.get("user_id")
+
+        if users is not None and not isinstance(users, (list, tuple, set)):
+
+            users = [users]
+
+        files = ["data/twitter_queries.db"]
+
+        if kwargs.get("query_term") is None:
+
+            if users is None:
+
+                files += [i for i in glob.glob("data/*.db") if _is_user_db(i)]
+
+                files += _shard_files()
+
+            else:
+
+                files += [f"data/{i}.db" for i in users]
+
+                files += sorted({_shard_path(i) for i in users} - {None})
+
+        frames = []
+
+        for file in files:
+
+            if not os.path.exists(file):
+
+                continue
+
+            table = query_table if file.endswith("twitter_queries.db") else "tweets"
+
+            engine = engines.get(file)
+
+            inspector = sqlalchemy.inspect(engine)
+
+            if not inspector.has_table(table):
+
+                continue
+
+            columns = {i["name"] for i in inspector.get_columns(table)}
+
+            if (
+                table == query_table
+                and users is not None
+                and "author_id" not in columns
+            ):
+
+                continue  # captured without author ids, so no tweet is attributable
+
+            if (
+                kwargs.get("start") is not None or kwargs.get("end") is not None
+            ) and "created_at" not in columns:
+
+                continue
+
+            where = []
+
+            params = {"match": match, "limit": limit}
+
+            if _is_shard(file) and users is not None:
+
+                where.append(
+                    f"t.user_id IN ({', '.join(f':owner{i}' for i in range(len(users)))})"
+                )
+
+                params.update({f"owner{i}": str(j) for i, j in enumerate(users)})
+
+            if table == query_table and kwargs.get("query_term") is not None:
+
+                where.append("t.query_term IN (:term, :parsed)")
+
+                params["term"] = kwargs["query_term"]
+
+                params["parsed"] = urllib.parse.quote(kwargs["query_term"])
+
+            if table == query_table and users is not None:
+
+                where.append(
+                    f"t.author_id IN ({', '.join(f':user{i}' for i in range(len(users)))})"
+                )
+
+                params.update({f"user{i}": int(j) for i, j in enumerate(users)})
+
+            if kwargs.get("start") is not None:
+
+                where.append("t.created_at >= :start")
+
+                params["start"] = _sql_time(kwargs["start"])
+
+            if kwargs.get("end") is not None:
+
+                where.append("t.created_at < :end")
+
+                params["end"] = _sql_time(kwargs["end"])
+
+            df = _search_text(
+                engine,
+                table,
+                where,
+                params,
+                kwargs.get("markers", ("**", "**")),
+            )
+
+            if df is None:  # no index in this file yet
+
+                continue
+
+            df.insert(0, "source", file)
+
+            if _is_user_db(file):
+
+                df["_owner"] = os.path.basename(file)[: -len(".db")]
+
+            elif _is_shard(file):
+
+                df["_owner"] = df["user_id"].astype(str)
+
+            frames.append(df)
+
+        if not frames:
+
+            return pandas.DataFrame(columns=["source", "rank", "snippet"])
+
+        df = pandas.concat(frames, ignore_index=True)
+
+        if "_owner" in df.columns:
+
+            copies = df["_owner"].notna() & df.duplicated(["_owner", "id"])
+
+            df = df[~copies].drop(columns="_owner")
+
+        return df.sort_values("rank").head(limit).reset_index(drop=True)
+
+    def query_users(self, sql: str, **kwargs):
+
+        """
+        Run one SQL statement over every per-user database and stream the combined rows. The files are ATTACHed to one connection in batches, within SQLite's attach limit, and each batch runs as a single UNION ALL. Users merged into shards are included, each scoped to their own rows. A user with rows in both their shard and their own database, kept by `keep_originals` or written since the merge, is read from the union of the two, and a row held in both is counted once.
+
+        Write the statement for one user, naming that user's schema `{db}`, and select named columns, since older files may lack newer ones. Each row is prefixed with the user_id. Each user's statement runs once over all of their rows, so per-user aggregates are complete as streamed; aggregate the stream for totals across users.
+
+        #### Parameters
+
+            sql : str - A SELECT over `{db}.profile`, `{db}.tweets`, `{db}.following` or `{db}.followers`. Files lacking a referenced table are skipped.
+
+            user_ids : list[str] - Only these users. Default: every data/{id}.db in the catalog, and every sharded user.
+
+            params : dict - Bound parameters for the statement.
+
+            batch : int - Files attached at once, at least 2 so a user's shard and database fit together. Capped at the connection's attach limit, usually 10.
+
+            chunksize : int - Rows per yielded DataFrame. Default 10000.
+
+        #### Yields
+
+            pandas.DataFrame - user_id, then the statement's columns.
+
+        #### Example
+
+            `sql = "SELECT date(created_at) AS day, COUNT(*) AS tweets, SUM(like_count + retweet_count + reply_count + quote_count) AS engagement FROM {db}.tweets GROUP BY day"`
+            `df = pandas.concat(Database_Functions().query_users(sql))`
+        """
+
+        needed = set(re.findall(r'\{db\}\."?(\w+)', sql))
+
+        sources = {}
+
+        for file, tables in catalog.refresh().items():
+
+            if _is_user_db(file):
+
+                user = os.path.basename(file)[: -len(".db")]
+
+                sources.setdefault(user, []).append((file, False, tables))
+
+        for file, tables in catalog.refresh(_shard_files()).items():
+
+            if "shard_users" not in tables:
+
+                continue
+
+            with engines.get(file).connect() as conn:
+
+                users = conn.execute(
+                    sqlalchemy.text("SELECT user_id FROM shard_users")
+                ).fetchall()
+
+            for (user,) in users:
+
+                sources.setdefault(str(user), []).insert(0, (file, True, tables))
+
+        units = [
+            (user, held)
+            for user, held in sources.items()
+            if needed <= {table for i in held for table in i[2]}
+        ]
+
+        if kwargs.get("user_ids") is not None:
+
+            wanted = {str(i) for i in kwargs["user_ids"]}
+
+            units = [i for i in units if i[0] in wanted]
+
+        engine = sqlalchemy.create_engine("sqlite://")
+
+        try:
+
+            with engine.connect() as conn:
+
+                try:
+
+                    limit = conn.connection.driver_connection.getlimit(
+                        sqlite3.SQLITE_LIMIT_ATTACHED
+                    )
+
+                except AttributeError:  # Python < 3.11
+
+                    limit = 10
+
+                batch = max(2, min(kwargs.get("batch", limit), limit))
+
+                batches = []
+
+                for unit in units:
+
+                    files = {i[0] for i in unit[1]}
+
+                    if not batches or len(batches[-1][0] | files) > batch:
+
+                        batches.append((set(), []))
+
+                    batches[-1][0].update(files)
+
+                    batches[-1][1].append(unit)
+
+                for files, members in batches:
+
+                    aliases = {file: f"u{n}" for n, file in enumerate(sorted(files))}
+
+                    for file, alias in aliases.items():
+
+                        conn.execute(
+                            sqlalchemy.text(f"ATTACH DATABASE :path AS {alias}"),
+                            {"path": file},
+                        )
+
+                    selects = [
+                        f"SELECT '{user}' AS user_id, * "
+                        f"FROM ({_scoped(sql, user, held, aliases)})"
+                        for user, held in members
+                    ]
+
+                    for group in range(0, len(selects), 250):  # compound SELECT limit
+
+                        yield from pandas.read_sql_query(
+                            sqlalchemy.text(
+                                " UNION ALL ".join(selects[group : group + 250])
+                            ),
+                            conn,
+                            params=kwargs.get("params"),
+                            chunksize=kwargs.get("chunksize", 10000),
+                        )
+
+                    for alias in aliases.values():
+
+                        conn.execute(sqlalchemy.text(f"DETACH DATABASE {alias}"))
+
+        finally:
+
+            engine.dispose()
+
+    def maintain(self, **kwargs) -> pandas.DataFrame:
+
+        """
+        Compact the data/ directory: deduplicate keyed tables, expire old query captures, optionally merge the per-user databases into shards, then VACUUM and ANALYZE every file.
+
+        #### Parameters
+
+            retention_days : int - Delete query captures taken more than this many days ago. Default: keep everything.
+
+            shards : int - Merge every data/{id}.db into this many files under data/shards, by user id modulo the count. Each original is deleted once its shard is checked to hold all its rows. A store that is already sharded keeps its count. Default: no merging.
+
+            keep_originals : bool - Default `False`. If `True`, merge but keep every data/{id}.db; readers combine both copies and a later run merges them again harmlessly.
+
+            vacuum : bool - Default `True`. Rebuild each file to release its free pages. Full-text indexes are rebuilt after, since VACUUM may renumber rows.
+
+        #### Returns
+
+            pandas.DataFrame - Per file: bytes before and after, bytes reclaimed, duplicate rows deleted, captures expired and rows merged into a shard. Merged files that were deleted have 0 bytes after.
+
+        #### Example
+
+            `Database_Functions().maintain(retention_days=90, shards=16)['reclaimed'].sum()`
+        """
+
+        files = sorted(glob.glob("data/*.db")) + _shard_files()
+
+        report = {i: _maintenance_row(i) for i in files}
+
+        for file in files:
+
+            with engines.get(file).begin() as conn:
+
+                for table in sqlalchemy.inspect(conn).get_table_names():
+
+                    key = _table_key(file, table)
+
+                    if key is not None:
+
+                        report[file]["deduplicated"] += _add_key(conn, table, key)
+
+        queries = os.path.normpath("data/twitter_queries.db")
+
+        if kwargs.get("retention_days") is not None and queries in report:
+
+            cutoff = datetime.datetime.now() - datetime.timedelta(
+                days=kwargs["retention_days"]
+            )
+
+            with engines.get(queries).begin() as conn:
+
+                if sqlalchemy.inspect(conn).has_table(query_table):
+
+                    report[queries]["expired"] = conn.execute(
+                        sqlalchemy.text(
+                            f"DELETE FROM {query_table} WHERE capture_timestamp < :cutoff"
+                        ),
+                        {"cutoff": _sql_time(cutoff)},
+                    ).rowcount
+
+        if kwargs.get("shards"):
+
+            existing = _shard_files()
+
+            count = (
+                int(re.search(r"-of-(\d+)\.db$", existing[0]).group(1))
+                if existing
+                else kwargs["shards"]
+            )
+
+            os.makedirs(shard_root, exist_ok=True)
+
+            for file in [i for i in files if _is_user_db(i)]:
+
+                user = int(os.path.basename(file)[: -len(".db")])
+
+                shard = os.path.join(
+                    shard_root, f"{user % count:03d}-of-{count:03d}.db"
+                )
+
+                report.setdefault(shard, _maintenance_row(shard))
+
+                report[file]["merged"] = _merge_user_db(
+                    file, shard, keep=kwargs.get("keep_originals", False)
+                )
+
+        for file in report:
+
+            if kwargs.get("vacuum", True) and os.path.exists(file):
+
+                _compact(file)
+
+            report[file]["after"] = _disk_size(file)
+
+            report[file]["reclaimed"] = report[file]["before"] - report[file]["after"]
+
+        return pandas.DataFrame(
+            list(report.values()),
+            columns=[
+                "file",
+                "before",
+                "after",
+                "reclaimed",
+                "deduplicated",
+                "expired",
+                "merged",
+            ],
+        )
+
+    def list_db_tables(self, db):
+
+        """
+        The catalog entry of one database, rescanned only if the file changed.
+
+        #### Returns
+
+            dict - {table: {'rows': int, 'columns': {name: declared type}}}
+        """
+
+        return catalog.refresh([db]).get(os.path.normpath(db), {})
+
+
+catalog = Database_Catalog()
+"""The process-wide database catalog, used by Database_Functions and get_dbs()."""
+
+
+class Streamlit_Functions:
+    def __init__(self):
+        """
+        A class for Streamlit utilities.
+        """
+
+    def set_boilerplate(self, **kwargs):
+        """
+        Boilerplate setup for a Streamlit page.
+
+        Parameters
+
+            page_title : str - The title bar page name.
+
+            scroll_text : str - The text to scroll when the page loads.
+
+            metrics : bool - Show the metrics during operations, in expanders.
+        """
+
+        if "page_title" in kwargs.keys():
+
+            page_title = str(kwargs["page_title"])
+
+        else:
+
+            page_title = "solarcho3/Web Tools"
+
+        scroll_text = ""
+
+        if kwargs.get("scroll_text"):
+
+            scroll_text = str(kwargs["scroll_text"])
+
+        import streamlit as st
+
+        st.set_page_config(page_title=page_title, page_icon=":wrench:", layout="wide")
+
+        if kwargs.get("metrics", False):
+
+            with st.expander("🌡️ Twitter API-server rate limit metrics"):
+
+                self.metrics_col1, self.metrics_col2, self.metrics_col3 = st.columns(3)
+
+            with st.expander("📻 Traffic log"):
+
+                traffic = st.columns(1)
+
+        scroll_container = st.empty()
+
+        store = ""
+
+        for char in scroll_text:
+
+            store = store + char
+
+            scroll_container.text(store)
+
+            time.sleep(0.005)
+
+    def update_metrics(self, data):
+        """
+        Update the boilerplate metrics.
+        """
+
+        keys_list = list(data.keys())
+
+        self.metrics_col1.metric(
+            f"{keys_list[0]} % remaining",
+            data[keys_list[0]]["percent_remaining"],
+            round((1000 / data[keys_list[0]]["remaining"]) * -1, 2),
+        )
+
+        self.metrics_col2.metric(
+            keys_list[0], data[keys_list[0]]["limit"], data[keys_list[0]]["remaining"]
+        )
+
+
+_endpoints = [
+    (re.compile(r"/2/users/by/username/"), "user_profile"),
+    (re.compile(r"/2/users/by\?"), "user_profiles"),
+    (re.compile(r"/2/users/\d+/tweets"), "user_tweets"),
+    (re.compile(r"/2/users/\d+/following"), "user_following"),
+    (re.compile(r"/2/users/\d+/followers"), "user_followers"),
+    (re.compile(r"/2/tweets/search/recent"), "query"),
+]
+"""URL path patterns mapped to their limit log endpoint."""
+
+
+def _endpoint_of(url: str) -> str:
+
+    """
+    Name the endpoint of a Twitter API URL, as used by the limit log. Unknown URLs are 'default'.
+    """
+
+    for pattern, endpoint in _endpoints:
+
+        if pattern.search(url):
+
+            return endpoint
+
+    return "default"
+
+
+def _token_id(token: str) -> str:
+
+    """
+    A short, stable identity for a bearer token, safe to log and store.
+    """
+
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+def _checkpointed(kwargs: dict) -> bool:
+
+    """
+    Whether a paginated getter was asked to checkpoint its crawl: `checkpoint=True`, or `resume=True` without `checkpoint=False`.
+    """
+
+    return kwargs.get("checkpoint", kwargs.get("resume", False))
+
+
+def _newer_than(records: list, since_id: str) -> tuple:
+
+    """
+    Drop records whose id is not newer than since_id.
+
+    #### Returns
+
+        (list, bool) - The newer records, and `True` if any known records were dropped, meaning pagination has caught up.
+    """
+
+    if since_id is None:
+
+        return records, False
+
+    new = [i for i in records if int(i["id"]) > int(since_id)]
+
+    return new, len(new) < len(records)
+
+
+_user_columns = {
+    "capture_timestamp": sqlalchemy.DateTime,
+    "id": sqlalchemy.Integer,
+    "name": sqlalchemy.Text,
+    "username": sqlalchemy.Text,
+    "description": sqlalchemy.Text,
+    "profile_image_url": sqlalchemy.Text,
+    "created_at": sqlalchemy.DateTime,
+    "followers_count": sqlalchemy.Integer,
+    "following_count": sqlalchemy.Integer,
+    "tweet_count": sqlalchemy.Integer,
+    "listed_count": sqlalchemy.Integer,
+}
+
+_tweet_columns = {
+    "capture_timestamp": sqlalchemy.DateTime,
+    "id": sqlalchemy.Integer,
+    "text": sqlalchemy.Text,
+    "created_at": sqlalchemy.DateTime,
+    "author_id": sqlalchemy.Integer,
+    "conversation_id": sqlalchemy.Integer,
+    "edit_history_tweet_ids": sqlalchemy.Text,
+    "retweet_count": sqlalchemy.Integer,
+    "reply_count": sqlalchemy.Integer,
+    "like_count": sqlalchemy.Integer,
+    "quote_count": sqlalchemy.Integer,
+    "impression_count": sqlalchemy.Integer,
+}
+
+storage_schemas = {
+    "profile": _user_columns,
+    "tweets": _tweet_columns,
+    "following": _user_columns,
+    "followers": _user_columns,
+    "query": {
+        "query_term": sqlalchemy.Text,
+        "transaction_id": sqlalchemy.Text,
+        "index": sqlalchemy.Integer,
+        **_tweet_columns,
+    },
+}
+"""Declared column types per df_to_db() type. Columns not declared here are stored as TEXT, or with the type pandas infers for numbers."""
+
+storage_keys = {
+    "tweets": ("id",),
+    "following": ("id",),
+    "followers": ("id",),
+    "query": ("query_term", "id"),
+}
+"""The unique key of each df_to_db() type. Rows whose key is already stored are not appended again."""
+
+_metric_columns = (
+    "retweet_count",
+    "reply_count",
+    "like_count",
+    "quote_count",
+    "impression_count",
+    "followers_count",
+    "following_count",
+    "tweet_count",
+    "listed_count",
+)
+
+query_table = "query_results"
+"""The table of data/twitter_queries.db that every query capture is written to."""
+
+_query_indexes = {
+    "ix_query_results_term_capture": ("query_term", "capture_timestamp"),
+    "ix_query_results_capture": ("capture_timestamp",),
+    "ix_query_results_id": ("id",),
+}
+
+
+parquet_root = "data/parquet"
+"""Root of the columnar store: one hive-partitioned Parquet dataset per df_to_db() type."""
+
+
+def _parquet_partitioning(type: str):
+
+    """
+    The hive partitioning of a type's dataset. Partition values are kept as strings, so 19-digit user ids survive.
+    """
+
+    if type not in storage_schemas:
+
+        raise ValueError("type must be one of: profile, tweets, following, query")
+
+    if pyarrow is None:
+
+        raise ImportError("the parquet backend needs pyarrow: pip install pyarrow")
+
+    columns = (
+        ("capture_date", "query_term")
+        if type == "query"
+        else ("user_id", "capture_date")
+    )
+
+    return pyarrow.dataset.partitioning(
+        pyarrow.schema([(i, pyarrow.string()) for i in columns]), flavor="hive"
+    )
+
+
+def _write_parquet(id: str, data: pandas.DataFrame, type: str) -> None:
+
+    """
+    Append a typed frame to its type's Parquet dataset, as new files under the frame's partitions.
+    """
+
+    partitioning = _parquet_partitioning(type)
+
+    data = data.assign(capture_date=data["capture_timestamp"].dt.strftime("%Y-%m-%d"))
+
+    if type == "query":
+
+        data["query_term"] = data["query_term"].astype(str)
+
+    else:
+
+        data["user_id"] = str(id)
+
+    pyarrow.dataset.write_dataset(
+        pyarrow.Table.from_pandas(data, preserve_index=False),
+        os.path.join(parquet_root, type),
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _read_parquet(id: str, type: str, **kwargs) -> pandas.DataFrame:
+
+    """
+    Read a type's Parquet dataset. Filters on partition columns skip whole directories; the others are pushed down to row-group statistics. The matching files are read with their unified schema, since later writes may add columns.
+    """
+
+    partitioning = _parquet_partitioning(type)
+
+    path = os.path.join(parquet_root, type)
+
+    empty = pandas.DataFrame(columns=kwargs.get("columns"))
+
+    if not os.path.isdir(path):
+
+        return iter([]) if kwargs.get("chunksize") else empty
+
+    field = pyarrow.dataset.field
+
+    filters = []
+
+    if id is not None:
+
+        filters.append(
+            field("transaction_id") == str(id)
+            if type == "query"
+            else field("user_id") == str(id)
+        )
+
+    if kwargs.get("query_term") is not None:
+
+        term = kwargs["query_term"]
+
+        filters.append(field("query_term").isin([term, urllib.parse.quote(term)]))
+
+    time = kwargs.get("time_column", "capture_timestamp")
+
+    if kwargs.get("start") is not None:
+
+        start = _utc_naive(kwargs["start"])
+
+        if time == "capture_timestamp":
+
+            filters.append(field("capture_date") >= start.strftime("%Y-%m-%d"))
+
+        filters.append(field(time) >= start)
+
+    if kwargs.get("end") is not None:
+
+        end = _utc_naive(kwargs["end"])
+
+        if time == "capture_timestamp":
+
+            filters.append(field("capture_date") <= end.strftime("%Y-%m-%d"))
+
+        filters.append(field(time) < end)
+
+    if kwargs.get("since_id") is not None:
+
+        filters.append(field("id") > int(kwargs["since_id"]))
+
+    if kwargs.get("until_id") is not None:
+
+        filters.append(field("id") < int(kwargs["until_id"]))
+
+    expression = None
+
+    for i in filters:
+
+        expression = i if expression is None else expression & i
+
+    dataset = pyarrow.dataset.dataset(path, format="parquet", partitioning=partitioning)
+
+    schemas = [i.physical_schema for i in dataset.get_fragments(filter=expression)]
+
+    if not schemas:
+
+        return iter([]) if kwargs.get("chunksize") else empty
+
+    schemas.append(partitioning.schema)
+
+    try:
+
+        schema = pyarrow.unify_schemas(schemas, promote_options="permissive")
+
+    except TypeError:  # pyarrow < 14 cannot promote types
+
+        schema = pyarrow.unify_schemas(schemas)
+
+    dataset = pyarrow.dataset.dataset(
+        path, schema=schema, format="parquet", partitioning=partitioning
+    )
+
+    types = {pyarrow.int64(): pandas.Int64Dtype()}.get
+
+    if kwargs.get("chunksize"):
+
+        batches = dataset.to_batches(
+            columns=kwargs.get("columns"),
+            filter=expression,
+            batch_size=kwargs["chunksize"],
+        )
+
+        return (i.to_pandas(types_mapper=types) for i in batches if i.num_rows)
+
+    if kwargs.get("limit") is not None:
+
+        table = dataset.head(
+            kwargs["limit"], columns=kwargs.get("columns"), filter=expression
+        )
+
+    else:
+
+        table = dataset.to_table(columns=kwargs.get("columns"), filter=expression)
+
+    return table.to_pandas(types_mapper=types)
+
+
+def _index_query_table(engine) -> None:
+
+    """
+    Create the query_results indexes if they are missing.
+    """
+
+    with engine.begin() as conn:
+
+        for name, columns in _query_indexes.items():
+
+            conn.execute(
+                sqlalchemy.text(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {query_table} "
+                    f"({', '.join(columns)})"
+                )
+            )
+
+
+def _pivot_profile(df: pandas.DataFrame) -> pandas.DataFrame:
+
+    """
+    Turn get_user_profile()'s one-row-per-metric layout into one row per capture, with a column per metric. The n-th occurrence of a metric belongs to the n-th capture.
+    """
+
+    if not {"metric", "public_metrics"} <= set(df.columns):
+
+        return df
+
+    keys = [i for i in df.columns if i not in ("metric", "public_metrics")]
+
+    rows = []
+
+    for _, group in df.groupby(df.groupby("metric").cumcount(), sort=True):
+
+        row = group.iloc[0][keys].to_dict()
+
+        row.update(dict(zip(group["metric"], group["public_metrics"])))
+
+        rows.append(row)
+
+    return pandas.DataFrame(rows, columns=keys + list(dict.fromkeys(df["metric"])))
+
+
+def _apply_schema(data: pandas.DataFrame, type: str) -> tuple:
+
+    """
+    Flatten and coerce a frame to its declared storage schema.
+
+    #### Returns
+
+        (pandas.DataFrame, dict) - The typed frame, and the to_sql() dtype for every declared or text column.
+    """
+
+    schema = storage_schemas[type]
+
+    if type == "profile":
+
+        data = _pivot_profile(data)
+
+    data = _flatten_metrics(data)
+
+    dtype = {}
+
+    for column in data.columns:
+
+        kind = schema.get(column)
+
+        if kind is sqlalchemy.Integer:
+
+            data[column] = pandas.to_numeric(data[column], errors="coerce").astype(
+                "Int64"
+            )
+
+        elif kind is sqlalchemy.DateTime:
+
+            data[column] = _to_datetime(data[column]).dt.tz_convert(None)
+
+        elif pandas.api.types.is_string_dtype(data[column]) or (
+            pandas.api.types.is_object_dtype(data[column])
+            and any(isinstance(i, (dict, list)) for i in data[column])
+        ):
+
+            data[column] = [
+                json.dumps(i) if isinstance(i, (dict, list)) else i
+                for i in data[column]
+            ]
+
+            kind = kind or sqlalchemy.Text
+
+        elif pandas.api.types.is_bool_dtype(data[column]):
+
+            kind = sqlalchemy.Boolean
+
+        elif pandas.api.types.is_integer_dtype(data[column]):
+
+            kind = sqlalchemy.Integer
+
+        elif pandas.api.types.is_float_dtype(data[column]):
+
+            kind = sqlalchemy.Float
+
+        if kind is not None:
+
+            dtype[column] = kind
+
+    return data, dtype
+
+
+def _write(engine, table: str, data: pandas.DataFrame, type: str, dtype: dict) -> None:
+
+    """
+    Commit a typed frame to a table in one transaction, adding missing columns first. Writes to the same database from several threads are serialised.
+    """
+
+    with engines.write_lock(engine):
+
+        _add_missing_columns(engine, table, dtype)
+
+        with engine.begin() as conn:
+
+            _store(conn, table, data, type, dtype)
+
+        if type == "query":
+
+            _index_query_table(engine)
+
+
+def _store(
+    conn, table: str, data: pandas.DataFrame, type: str, dtype: dict, key: tuple = None
+) -> None:
+
+    """
+    Write a typed frame. Keyed types are upserted: new keys are inserted, stored keys get their metric columns refreshed. The table's unique index is created on first use, after collapsing any duplicates an older append-only table holds. `key` overrides the type's storage key.
+    """
+
+    key = key or storage_keys.get(type)
+
+    if key is None or not set(key) <= set(data.columns):
+
+        data.to_sql(name=table, con=conn, if_exists="append", index=False, dtype=dtype)
+
+        return
+
+    if not sqlalchemy.inspect(conn).has_table(table):
+
+        data.head(0).to_sql(name=table, con=conn, index=False, dtype=dtype)
+
+    _add_key(conn, table, key)
+
+    if type in ("tweets", "query") and "text" in data.columns:
+
+        _index_text(conn, table)
+
+    data.to_sql(
+        name=table,
+        con=conn,
+        if_exists="append",
+        index=False,
+        dtype=dtype,
+        method=functools.partial(
+            _upsert, key=key, refresh=[i for i in data.columns if i in _metric_columns]
+        ),
+    )
+
+
+def _upsert(table, conn, columns: list, rows, key: tuple = (), refresh: list = ()):
+
+    """
+    A to_sql() insert method: INSERT ... ON CONFLICT (key) DO UPDATE the refresh columns, or DO NOTHING if there are none.
+    """
+
+    statement = sqlalchemy.dialects.sqlite.insert(table.table)
+
+    if refresh:
+
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={i: statement.excluded[i] for i in refresh},
+        )
+
+    else:
+
+        statement = statement.on_conflict_do_nothing(index_elements=list(key))
+
+    return conn.execute(statement, [dict(zip(columns, row)) for row in rows]).rowcount
+
+
+def _add_key(conn, table: str, key: tuple) -> int:
+
+    """
+    Create the table's unique key index if it is missing, deduplicating the table first.
+
+    #### Returns
+
+        int - The number of duplicate rows deleted.
+    """
+
+    name = f"ux_{table}_key"
+
+    exists = conn.execute(
+        sqlalchemy.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+        ),
+        {"name": name},
+    ).fetchone()
+
+    if exists is not None:
+
+        return 0
+
+    deleted = _deduplicate(conn, table, key)
+
+    columns = ", ".join(f'"{i}"' for i in key)
+
+    conn.execute(
+        sqlalchemy.text(f'CREATE UNIQUE INDEX "{name}" ON "{table}" ({columns})')
+    )
+
+    return deleted
+
+
+def _deduplicate(conn, table: str, key: tuple) -> int:
+
+    """
+    Collapse rows sharing a key into the first one stored, carrying over the metric counts of the latest one. Rows with a NULL key are left alone.
+
+    #### Returns
+
+        int - The number of rows deleted.
+    """
+
+    columns = {i["name"] for i in sqlalchemy.inspect(conn).get_columns(table)}
+
+    refresh = [f'"{i}"' for i in _metric_columns if i in columns]
+
+    group = ", ".join(f'"{i}"' for i in key)
+
+    keyed = " AND ".join(f'"{i}" IS NOT NULL' for i in key)
+
+    match = " AND ".join(f'n."{i}" = "{table}"."{i}"' for i in key)
+
+    if refresh:
+
+        conn.execute(
+            sqlalchemy.text(
+                f'UPDATE "{table}" SET ({", ".join(refresh)}) = '
+                f'(SELECT {", ".join(refresh)} FROM "{table}" AS n WHERE {match} '
+                "ORDER BY n.rowid DESC LIMIT 1) "
+                f'WHERE rowid IN (SELECT MIN(rowid) FROM "{table}" WHERE {keyed} '
+                f"GROUP BY {group} HAVING COUNT(*) > 1)"
+            )
+        )
+
+    return conn.execute(
+        sqlalchemy.text(
+            f'DELETE FROM "{table}" WHERE {keyed} AND rowid NOT IN '
+            f'(SELECT MIN(rowid) FROM "{table}" WHERE {keyed} GROUP BY {group})'
+        )
+    ).rowcount
+
+
+def _index_text(conn, table: str, rebuild: bool = False) -> None:
+
+    """
+    Give a table of tweets an external-content FTS5 index over its text, named {table}_fts, kept in sync by insert, delete and text-update triggers. A new index is filled from the stored rows; `rebuild` refills an existing one.
+    """
+
+    fts = f"{table}_fts"
+
+    exists = conn.execute(
+        sqlalchemy.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+        {"name": fts},
+    ).fetchone()
+
+    if exists is not None and not rebuild:
+
+        return
+
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+        f"USING fts5(text, content='{table}', content_rowid='rowid')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON "{table}" BEGIN '
+        f"INSERT INTO {fts} (rowid, text) VALUES (new.rowid, new.text); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, text) VALUES ('delete', old.rowid, old.text); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF text ON "{table}" BEGIN '
+        f"INSERT INTO {fts} ({fts}, rowid, text) VALUES ('delete', old.rowid, old.text); "
+        f"INSERT INTO {fts} (rowid, text) VALUES (new.rowid, new.text); END",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+    for statement in statements:
+
+        conn.execute(sqlalchemy.text(statement))
+
+
+def _search_text(engine, table: str, where: list, params: dict, markers: tuple):
+
+    """
+    Run one ranked FTS5 match against a table and its index. Returns None if the table has no index.
+    """
+
+    fts = f"{table}_fts"
+
+    with engine.connect() as conn:
+
+        exists = conn.execute(
+            sqlalchemy.text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {"name": fts},
+        ).fetchone()
+
+    if exists is None:
+
+        return None
+
+    sql = (
+        f"SELECT bm25({fts}) AS rank, "
+        f"snippet({fts}, 0, :open, :close, '...', 16) AS snippet, t.* "
+        f'FROM {fts} JOIN "{table}" AS t ON t.rowid = {fts}.rowid '
+        f"WHERE {fts} MATCH :match "
+        + "".join(f"AND {i} " for i in where)
+        + "ORDER BY rank LIMIT :limit"
+    )
+
+    return pandas.read_sql_query(
+        sqlalchemy.text(sql),
+        engine,
+        params={**params, "open": markers[0], "close": markers[1]},
+        parse_dates=["capture_timestamp", "created_at"],
+    )
+
+
+def _select(table: sqlalchemy.Table, **kwargs):
+
+    """
+    Compile db_to_df()'s columns, query_term, start, end, time_column, since_id, until_id and limit into a SELECT on a reflected table.
+    """
+
+    if kwargs.get("columns"):
+
+        statement = sqlalchemy.select(*[table.c[i] for i in kwargs["columns"]])
+
+    else:
+
+        statement = sqlalchemy.select(table)
+
+    if kwargs.get("query_term") is not None:
+
+        term = kwargs["query_term"]
+
+        statement = statement.where(
+            table.c.query_term.in_({term, urllib.parse.quote(term)})
+        )
+
+    time = table.c[kwargs.get("time_column", "capture_timestamp")]
+
+    if kwargs.get("start") is not None:
+
+        statement = statement.where(time >= _utc_naive(kwargs["start"]))
+
+    if kwargs.get("end") is not None:
+
+        statement = statement.where(time < _utc_naive(kwargs["end"]))
+
+    if kwargs.get("since_id") is not None:
+
+        statement = statement.where(table.c.id > int(kwargs["since_id"]))
+
+    if kwargs.get("until_id") is not None:
+
+        statement = statement.where(table.c.id < int(kwargs["until_id"]))
+
+    if kwargs.get("limit") is not None:
+
+        statement = statement.limit(kwargs["limit"])
+
+    return statement
+
+
+def _utc_naive(value) -> datetime.datetime:
+
+    """
+    A time as the naive datetime DATETIME columns are compared with. Aware times are converted to UTC first.
+    """
+
+    value = pandas.Timestamp(value)
+
+    if value.tzinfo is not None:
+
+        value = value.tz_convert(None)
+
+    return value.to_pydatetime()
+
+
+def _sql_time(value) -> str:
+
+    """
+    Format a time the way DATETIME columns are stored: naive UTC, microseconds.
+    """
+
+    return _utc_naive(value).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _is_user_db(path: str) -> bool:
+
+    """
+    Whether a file follows the data/{user id}.db naming of per-user databases.
+    """
+
+    return re.fullmatch(r"\d+\.db", os.path.basename(path)) is not None
+
+
+shard_root = "data/shards"
+"""Where Database_Functions.maintain() merges per-user databases: {k}-of-{n}.db files, each holding the users whose id is k modulo n, with a user_id column on every table."""
+
+
+def _shard_files() -> list:
+
+    return sorted(glob.glob(os.path.join(shard_root, "*-of-*.db")))
+
+
+def _is_shard(path: str) -> bool:
+
+    return re.fullmatch(r"\d+-of-\d+\.db", os.path.basename(path)) is not None
+
+
+def _shard_path(user_id):
+
+    """
+    The shard file a user belongs to, or None if the store has not been sharded.
+    """
+
+    files = _shard_files()
+
+    if not files or not str(user_id).isdigit():
+
+        return None
+
+    count = int(re.search(r"-of-(\d+)\.db$", files[0]).group(1))
+
+    return os.path.join(shard_root, f"{int(user_id) % count:03d}-of-{count:03d}.db")
+
+
+def _user_sources(user_id, table: str) -> list:
+
+    """
+    (engine, sharded) for the user's shard and own database, oldest first, where they hold the table.
+    """
+
+    sources = []
+
+    for path in (_shard_path(user_id), f"data/{user_id}.db"):
+
+        if path is None or not os.path.exists(path):
+
+            continue
+
+        engine = engines.get(path)
+
+        if sqlalchemy.inspect(engine).has_table(table):
+
+            sources.append((engine, _is_shard(path)))
+
+    return sources
+
+
+def _read_user(user_id, table_name: str, sources: list, **kwargs):
+
+    """
+    db_to_df() for a user's table spread over their shard and own database. Shard rows are scoped to the user and lose the user_id column; a row held in both keeps the database's newer copy.
+    """
+
+    reads = []
+
+    for engine, sharded in sources:
+
+        table = sqlalchemy.Table(
+            table_name, sqlalchemy.MetaData(), autoload_with=engine
+        )
+
+        if sharded:
+
+            columns = kwargs.get("columns") or [
+                i for i in table.c.keys() if i != "user_id"
+            ]
+
+            statement = _select(table, **{**kwargs, "columns": columns}).where(
+                table.c.user_id == str(user_id)
+            )
+
+        else:
+
+            statement = _select(table, **kwargs)
+
+        reads.append(
+            pandas.read_sql_query(
+                statement, con=engine, chunksize=kwargs.get("chunksize")
+            )
+        )
+
+    if kwargs.get("chunksize"):
+
+        return itertools.chain(*reads)
+
+    if len(reads) == 1:
+
+        return reads[0]
+
+    df = pandas.concat(reads, ignore_index=True)
+
+    key = list(storage_keys.get(table_name, ()))
+
+    if key and set(key) <= set(df.columns):
+
+        df = df.drop_duplicates(key, keep="last", ignore_index=True)
+
+    return df if kwargs.get("limit") is None else df.head(kwargs["limit"])
+
+
+def _scoped(sql: str, user: str, sources: list, aliases: dict) -> str:
+
+    """
+    Point a query_users() statement's {db} at one user's attached sources, given as (file, sharded, catalog tables) with the shard first. Shard rows are scoped to the user. A table held in both is read as their union, without the shard's user_id, and a row held in both keeps the database's newer copy, as in _read_user().
+    """
+
+    def table(match) -> str:
+
+        name = match.group(1)
+
+        held = [i for i in sources if name in i[2]]
+
+        if len(held) == 1 and not held[0][1]:
+
+            return f'{aliases[held[0][0]]}."{name}"'
+
+        if len(held) == 1:
+
+            return f"(SELECT * FROM {aliases[held[0][0]]}.\"{name}\" WHERE user_id = '{user}')"
+
+        (shard, _, shard_tables), (file, _, file_tables) = held
+
+        shard_columns = shard_tables[name]["columns"]
+
+        file_columns = file_tables[name]["columns"]
+
+        columns = [i for i in shard_columns if i != "user_id"]
+
+        columns += [i for i in file_columns if i not in columns]
+
+        def select(alias: str, stored: dict) -> str:
+
+            return ", ".join(
+                f'{alias}."{i}" AS "{i}"' if i in stored else f'NULL AS "{i}"'
+                for i in columns
+            )
+
+        key = (_table_key(shard, name) or ("user_id",))[1:]
+
+        newer = ""
+
+        if key and set(key) <= set(file_columns):
+
+            newer = (
+                f'AND NOT EXISTS (SELECT 1 FROM {aliases[file]}."{name}" AS f WHERE '
+                + " AND ".join(f'f."{i}" = s."{i}"' for i in key)
+                + ")"
+            )
+
+        return (
+            f"(SELECT {select('s', shard_columns)} "
+            f"FROM {aliases[shard]}.\"{name}\" AS s WHERE s.user_id = '{user}' {newer} "
+            f"UNION ALL SELECT {select('f', file_columns)} "
+            f'FROM {aliases[file]}."{name}" AS f)'
+        )
+
+    return re.sub(r'\{db\}\."?(\w+)"?', table, sql)
+
+
+def _table_key(file: str, table: str):
+
+    """
+    The unique key maintain() enforces on a stored table, or None.
+    """
+
+    if _is_user_db(file) and table in storage_keys:
+
+        return storage_keys[table]
+
+    if _is_shard(file) and table in storage_keys:
+
+        return ("user_id",) + storage_keys[table]
+
+    if _is_shard(file) and table == "profile":
+
+        return ("user_id", "capture_timestamp")
+
+    if os.path.basename(file) == "twitter_queries.db" and table == query_table:
+
+        return storage_keys["query"]
+
+    return None
+
+
+def _merge_user_db(file: str, shard: str, keep: bool = False) -> int:
+
+    """
+    Upsert every table of a per-user database into its shard, with a user_id column, and record the user in shard_users. Once the shard is checked to hold every key of the file, the file is deleted unless `keep` is set. Merging a kept file again is idempotent.
+
+    #### Returns
+
+        int - The number of rows merged.
+    """
+
+    user = os.path.basename(file)[: -len(".db")]
+
+    source = engines.get(file)
+
+    inspector = sqlalchemy.inspect(source)
+
+    frames = []
+
+    for table in ("profile", "tweets", "following", "followers"):
+
+        if inspector.has_table(table):
+
+            df, dtype = _apply_schema(_read_stored(source, table), table)
+
+            df.insert(0, "user_id", user)
+
+            frames.append((table, df, {"user_id": sqlalchemy.Text, **dtype}))
+
+    target = engines.get(shard)
+
+    for table, df, dtype in frames:
+
+        _add_missing_columns(target, table, dtype)
+
+    with target.begin() as conn:
+
+        conn.execute(
+            sqlalchemy.text(
+                "CREATE TABLE IF NOT EXISTS shard_users "
+                "(user_id TEXT PRIMARY KEY, merged_at TEXT)"
+            )
+        )
+
+        for table, df, dtype in frames:
+
+            key = _table_key(shard, table)
+
+            _store(conn, table, df, table, dtype, key=key)
+
+        conn.execute(
+            sqlalchemy.text(
+                "INSERT OR REPLACE INTO shard_users (user_id, merged_at) "
+                "VALUES (:user, :merged_at)"
+            ),
+            {"user": user, "merged_at": str(datetime.datetime.now())},
+        )
+
+    with target.connect() as conn:
+
+        for table, df, dtype in frames:
+
+            stored = conn.execute(
+                sqlalchemy.text(
+                    f'SELECT COUNT(*) FROM "{table}" WHERE user_id = :user'
+                ),
+                {"user": user},
+            ).scalar()
+
+            key = [i for i in _table_key(shard, table) if i != "user_id"]
+
+            if stored < len(df.drop_duplicates(key)):
+
+                raise RuntimeError(
+                    f"{shard} holds {stored} of the {len(df)} {table} rows of {file}; "
+                    "the file was kept"
+                )
+
+    if keep:
+
+        return sum(len(i[1]) for i in frames)
+
+    engines.dispose(file)
+
+    for suffix in ("", "-wal", "-shm"):
+
+        if os.path.exists(f"{file}{suffix}"):
+
+            os.remove(f"{file}{suffix}")
+
+    return sum(len(i[1]) for i in frames)
+
+
+def _compact(path: str) -> None:
+
+    """
+    VACUUM and ANALYZE one database, rebuild its full-text indexes, and truncate its WAL.
+    """
+
+    engine = engines.get(path)
+
+    with engine.connect() as conn:
+
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+            sqlalchemy.text("VACUUM")
+        )
+
+    with engine.begin() as conn:
+
+        indexes = conn.execute(
+            sqlalchemy.text(
+                "SELECT name FROM sqlite_master "
+                "WHERE sql LIKE 'CREATE VIRTUAL TABLE%USING fts5%'"
+            )
+        ).fetchall()
+
+        for (name,) in indexes:
+
+            _index_text(conn, name[: -len("_fts")], rebuild=True)
+
+        conn.execute(sqlalchemy.text("ANALYZE"))
+
+    with engine.connect() as conn:
+
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+            sqlalchemy.text("PRAGMA wal_checkpoint(TRUNCATE)")
+        )
+
+
+def _disk_size(path: str) -> int:
+
+    """
+    Bytes a database takes on disk, with its WAL and shared-memory files.
+    """
+
+    return sum(
+        os.path.getsize(f"{path}{i}")
+        for i in ("", "-wal", "-shm")
+        if os.path.exists(f"{path}{i}")
+    )
+
+
+def _maintenance_row(path: str) -> dict:
+
+    return {
+        "file": path,
+        "before": _disk_size(path),
+        "after": 0,
+        "reclaimed": 0,
+        "deduplicated": 0,
+        "expired": 0,
+        "merged": 0,
+    }
+
+
+def _to_datetime(values: pandas.Series) -> pandas.Series:
+
+    """
+    Parse ISO 8601 strings or datetimes to UTC. Unparseable values become NaT.
+    """
+
+    try:
+
+        return pandas.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+
+    except (TypeError, ValueError):  # pandas < 2.0 has no ISO8601 format
+
+        return pandas.to_datetime(values, errors="coerce", utc=True)
+
+
+def _add_missing_columns(engine, table: str, dtype: dict) -> None:
+
+    """
+    Add any dtype column an existing table lacks, so appends with new fields do not fail.
+    """
+
+    inspector = sqlalchemy.inspect(engine)
+
+    if not inspector.has_table(table):
+
+        return
+
+    existing = {i["name"] for i in inspector.get_columns(table)}
+
+    with engine.begin() as conn:
+
+        for column, kind in dtype.items():
+
+            if column not in existing:
+
+                conn.execute(
+                    sqlalchemy.text(
+                        f'ALTER TABLE "{table}" ADD COLUMN "{column}" '
+                        f"{kind().compile(dialect=engine.dialect)}"
+                    )
+                )
+
+
+def _typed(columns: list, type: str) -> bool:
+
+    """
+    Whether a stored table's declared column types, as returned by Inspector.get_columns(), already match the storage schema of its type.
+    """
+
+    schema = storage_schemas[type]
+
+    return all(
+        isinstance(i["type"], schema[i["name"]]) for i in columns if i["name"] in schema
+    )
+
+
+def _read_stored(engine, table: str) -> pandas.DataFrame:
+
+    """
+    Read a stored table, parsing back the dict and list reprs older versions of df_to_db() wrote as text.
+    """
+
+    df = pandas.read_sql_table(table_name=table, con=engine)
+
+    for column in df.columns:
+
+        if pandas.api.types.is_string_dtype(df[column]):
+
+            df[column] = [_parse_literal(i) for i in df[column]]
+
+    return df
+
+
+def _parse_literal(value):
+
+    """
+    Undo data.astype("str") on a stored value: 'nan' and 'None' become None, and dict or list reprs are parsed back.
+    """
+
+    if not isinstance(value, str):
+
+        return value
+
+    if value in ("nan", "None", "NaT", ""):
+
+        return None
+
+    if value[:1] in ("{", "["):
+
+        try:
+
+            return ast.literal_eval(value)
+
+        except (ValueError, SyntaxError):
+
+            return value
+
+    return value
+
+
+def _json_loads(content: bytes):
+
+    """
+    Decode a JSON body with the fastest available backend.
+    """
+
+    if orjson is not None:
+
+        return orjson.loads(content)
+
+    return json.loads(content)
+
+
+def _flatten_metrics(df: pandas.DataFrame) -> pandas.DataFrame:
+
+    """
+    Expand a `public_metrics` column of dictionaries into one column per metric.
+    """
+
+    if "public_metrics" not in df.columns:
+
+        return df
+
+    metrics = pandas.DataFrame.from_records(
+        [i if isinstance(i, dict) else {} for i in df["public_metrics"]], index=df.index
+    )
+
+    return pandas.concat([df.drop(labels="public_metrics", axis=1), metrics], axis=1)
+
+
+def _run_sync(coro):
+
+    """
+    Run a coroutine to completion from synchronous code. Inside a running event loop (e.g. Jupyter) it is run on a separate thread.
+    """
+
+    try:
+
+        asyncio.get_running_loop()
+
+    except RuntimeError:
+
+        return asyncio.run(coro)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+
+        return pool.submit(asyncio.run, coro).result()
 
 
 def random_line():